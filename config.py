@@ -14,9 +14,89 @@ DB_CONFIG = {
 # максимальное количество записей за 1 запрох в очереди GPU
 SUBCHUNK_MAX = 100
 
+# сколько ожидаемых попыток (ключей) планировщик кладёт в одну партию GPU,
+# чтобы тяжёлые шаблоны расходились по разным GPU
+SCHEDULER_BATCH_ATTEMPTS = 58 ** 5
+# через сколько секунд долгий шаблон можно отдать ещё и свободному GPU
+REBALANCE_AFTER = 30
+# сколько секунд воркер дорабатывает запуски при остановке, потом terminate
+WORKER_STOP_TIMEOUT = 10
+
+# бюджет на один шаблон: ожидаемое время перебора на всех устройствах, секунды
+COMPUTE_BUDGET_SECONDS = float(os.getenv('COMPUTE_BUDGET_SECONDS', 24 * 3600))
+# что делать со слишком сложными шаблонами: reject - статус error, defer - статус deferred
+OVER_BUDGET_ACTION = os.getenv('OVER_BUDGET_ACTION', 'reject')
+# скорость устройства (ключей/с) для оценки ETA, пока воркер не прислал замер
+ESTIMATE_GPU_KEYS_PER_SEC = 10_000_000
+ESTIMATE_CPU_KEYS_PER_SEC = 100_000
+
+# сколько строк забираем из БД за один запрос
+CLAIM_PAGE_SIZE = 100
+# сколько строк один сервер держит одновременно (в пуле и в поиске)
+CLAIM_MAX_HELD = 1000
+# через сколько секунд без продления строку in_progress может забрать другой сервер
+LEASE_SECONDS = 300
+
+# запись найденных адресов в БД пачками: по размеру или по времени (секунды)
+RESULT_BATCH_SIZE = 100
+RESULT_FLUSH_INTERVAL = 1.0
+# максимальная пауза между попытками, пока БД недоступна (секунды)
+RESULT_MAX_BACKOFF = 60
+# сюда пишутся результаты, пока БД недоступна; файл досылается и удаляется
+RESULT_SPILL_PATH = os.getenv('RESULT_SPILL_PATH', 'results.spill.jsonl')
+
+# метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics, порт 0 - выключено
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# запас заранее найденных ключей для коротких шаблонов, пусто - выключено
+# формат: "prefix__suffix:low:target,...", например "So__:10:50,x__pump"
+STOCK_PATTERNS = os.getenv('STOCK_PATTERNS', '')
+# ключ шифрования сидов в запасе, 32 байта в hex
+STOCK_KEY = os.getenv('STOCK_KEY', '')
+STOCK_PATH = os.getenv('STOCK_PATH', 'stock.bin')
+# когда ключей шаблона осталось low, свободные GPU добирают запас до target
+STOCK_LOW_WATER = 10
+STOCK_TARGET = 50
+
+# профилирование: каталог для Chrome trace (chrome://tracing) и сводки по фазам, пусто - выключено
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+# сколько событий хранить в trace одного процесса
+PROFILE_MAX_EVENTS = 200_000
+# как часто перезаписывать файлы trace (секунды)
+PROFILE_WRITE_INTERVAL = 10
+
 # больше итераций бит, болше диапазон
-DEFAULT_ITERATION_BITS = 24  # от 8 - 256
+DEFAULT_ITERATION_BITS = 24  # от 8 до 63
 DEFAULT_LOCAL_WORK_SIZE = 32
 
-# если за 100 шагов не удалось подобрать, значит стоп
-MAX_FIND_STEPS = 100
\ No newline at end of file
+# сколько найденных ключей GPU может вернуть за один запуск
+DEFAULT_HIT_CAPACITY = 128
+
+# сколько ключей один work item считает с одной общей инверсией (степень двойки)
+DEFAULT_INVERSION_BATCH = 1
+
+# сколько ключей перебирает один work item за запуск (кратно DEFAULT_INVERSION_BATCH)
+DEFAULT_KEYS_PER_ITEM = 16
+
+# сколько запусков одновременно стоит в очереди GPU (пока читаем один, другой уже считает)
+DEFAULT_PIPELINE_DEPTH = 2
+
+# сколько шаблонов одно устройство ищет одновременно (слоты таблицы на GPU)
+DEFAULT_PATTERN_CAPACITY = 256
+
+# каталог для скомпилированных OpenCL-программ (ключ: устройство, драйвер, опции, хеш исходника)
+PROGRAM_CACHE_DIR = os.getenv('PROGRAM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'solvanitycl'))
+
+# CPU-бэкенд: auto - только если нет GPU, on - ещё и в помощь GPU, off - никогда
+CPU_WORKER = os.getenv('CPU_WORKER', 'auto')
+# CPU медленнее на порядки, поэтому запуск меньше
+DEFAULT_CPU_ITERATION_BITS = 16
+
+# результаты tune по устройствам (JSON), подхватываются Searcher при старте
+DEVICE_PROFILES_PATH = os.getenv('DEVICE_PROFILES_PATH', os.path.join(PROGRAM_CACHE_DIR, 'profiles.json'))
+
+# если перебрали в столько раз больше ключей, чем ожидалось, а адреса нет, значит стоп
+ATTEMPT_BUDGET_FACTOR = 20
+# но не меньше стольких запусков: короткие шаблоны иначе сдаются за один запуск
+ATTEMPT_BUDGET_MIN_LAUNCHES = 8
\ No newline at end of file
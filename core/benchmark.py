@@ -0,0 +1,217 @@
+import multiprocessing
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.config import HostSetting
+from core.opencl.manager import get_all_devices, get_selected_gpu_devices
+from core.searcher import Searcher
+from core.utils.filters import BASE58_ALPHABET
+
+BENCHMARK_SEED = b"SolVanityCL benchmark seed"
+
+# (shape, prefix length, suffix length)
+BENCHMARK_SHAPES = [
+    ("prefix", 4, 0),
+    ("suffix", 0, 4),
+    ("mixed", 3, 2),
+]
+BENCHMARK_PATTERN_COUNTS = [1, 10, 100]
+
+# a workload is a regression when it loses more than this share of keys/s
+REGRESSION_THRESHOLD = 0.05
+
+# workload measured by the scaling run, on 1..N devices at once
+SCALING_WORKLOAD = "mixed-10-cs"
+
+
+def benchmark_pairs(count: int, prefix_length: int, suffix_length: int) -> List[Tuple[int, str, str]]:
+    rng = random.Random(f"{count}:{prefix_length}:{suffix_length}")
+    # skip '1', a leading '1' is a zero byte and would make prefixes unrealistically rare
+    prefix_alphabet = BASE58_ALPHABET[1:]
+    return [
+        (
+            row_id,
+            "".join(rng.choice(prefix_alphabet) for _ in range(prefix_length)),
+            "".join(rng.choice(BASE58_ALPHABET) for _ in range(suffix_length)),
+        )
+        for row_id in range(count)
+    ]
+
+
+def benchmark_workloads() -> List[Tuple[str, List[Tuple[int, str, str]], bool]]:
+    workloads = []
+    for shape, prefix_length, suffix_length in BENCHMARK_SHAPES:
+        for count in BENCHMARK_PATTERN_COUNTS:
+            pairs = benchmark_pairs(count, prefix_length, suffix_length)
+            for case_sensitive in (True, False):
+                name = f"{shape}-{count}-{'cs' if case_sensitive else 'ci'}"
+                workloads.append((name, pairs, case_sensitive))
+    return workloads
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_workload(
+    searcher: Searcher,
+    pairs: List[Tuple[int, str, str]],
+    case_sensitive: bool,
+    launches: int,
+) -> dict:
+    searcher.set_search_params_batch(pairs, [case_sensitive] * len(pairs))
+    params_time = searcher.stage_times["params"]
+
+    # fill the pipeline before measuring
+    for _ in range(searcher.pipeline_depth):
+        searcher.find(False)
+
+    latencies = []
+    stages: Dict[str, float] = {}
+    hits = 0
+    st = time.time()
+    for _ in range(launches):
+        hits += len(searcher.find(False))
+        latencies.append(searcher.prev_time)
+        for stage, seconds in searcher.stage_times.items():
+            if stage != "params":
+                stages[stage] = stages.get(stage, 0.0) + seconds
+    elapsed = time.time() - st
+    searcher.drain()
+
+    keys = launches * searcher.global_worker_size * searcher.setting.keys_per_item
+    return {
+        "keys_per_sec": keys / elapsed,
+        "launch_latency_ms": {
+            "p50": percentile(latencies, 0.5) * 1000,
+            "p90": percentile(latencies, 0.9) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+        },
+        "host_ms": dict(
+            {stage: seconds / launches * 1000 for stage, seconds in stages.items()},
+            params=params_time * 1000,
+        ),
+        "hits": hits,
+        "launches": launches,
+    }
+
+
+def run_benchmark(
+    kernel_source: str,
+    setting: HostSetting,
+    index: int,
+    launches: int,
+    device_type: int,
+    chosen_devices: Optional[Tuple[int, List[int]]] = None,
+    only: Optional[List[str]] = None,
+) -> dict:
+    """Run every workload from benchmark_workloads on one device with a fixed seed."""
+    searcher = Searcher(kernel_source, index, setting, chosen_devices, device_type)
+    report = {
+        "device": {
+            "name": searcher.device.name,
+            "platform": searcher.device.platform.name,
+            "driver": searcher.device.driver_version,
+        },
+        "setting": {
+            "iteration_bits": setting.iteration_bits,
+            "local_work_size": setting.local_work_size,
+            "inversion_batch": setting.inversion_batch,
+            "keys_per_item": setting.keys_per_item,
+            "pipeline_depth": setting.pipeline_depth,
+        },
+        "workloads": {},
+    }
+    for name, pairs, case_sensitive in benchmark_workloads():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        report["workloads"][name] = run_workload(searcher, pairs, case_sensitive, launches)
+    return report
+
+
+def compare_reports(
+    report: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD
+) -> List[str]:
+    """Return one line per workload whose keys/s fell more than `threshold` below the baseline."""
+    regressions = []
+    for name, stats in report["workloads"].items():
+        base = baseline.get("workloads", {}).get(name)
+        if not base:
+            continue
+        change = stats["keys_per_sec"] / base["keys_per_sec"] - 1
+        stats["vs_baseline"] = change
+        if change < -threshold:
+            regressions.append(
+                f"{name}: {stats['keys_per_sec'] / 1e6:.2f} MH/s vs "
+                f"{base['keys_per_sec'] / 1e6:.2f} MH/s ({change * 100:+.1f}%)"
+            )
+    return regressions
+
+
+def scaling_worker(args) -> None:
+    kernel_source, setting, index, launches, device_type, chosen_devices, workload, barrier, results = args
+    try:
+        searcher = Searcher(kernel_source, index, setting, chosen_devices, device_type)
+        name, pairs, case_sensitive = workload
+        # measure all devices over the same wall-clock window
+        barrier.wait()
+        stats = run_workload(searcher, pairs, case_sensitive, launches)
+        results.put((index, stats["keys_per_sec"]))
+    except Exception:
+        # release the other devices waiting on the barrier
+        barrier.abort()
+        results.put((index, None))
+        raise
+
+
+def run_scaling(
+    kernel_source: str,
+    setting: HostSetting,
+    launches: int,
+    device_type: int,
+    chosen_devices: Optional[Tuple[int, List[int]]] = None,
+    workload_name: str = SCALING_WORKLOAD,
+) -> dict:
+    """
+    Run one workload on 1, 2, ... N devices concurrently, one process per
+    device as the server does, and report aggregate keys/s and the efficiency
+    against N times the single-device rate.
+    """
+    if chosen_devices is None:
+        device_count = len(get_all_devices(device_type))
+    else:
+        device_count = len(get_selected_gpu_devices(*chosen_devices, device_type=device_type))
+    workload = next(w for w in benchmark_workloads() if w[0] == workload_name)
+
+    ctx = multiprocessing.get_context("spawn")
+    report = {"workload": workload_name, "devices": {}}
+    single = None
+    for count in range(1, device_count + 1):
+        barrier = ctx.Barrier(count)
+        results = ctx.Queue()
+        processes = [
+            ctx.Process(
+                target=scaling_worker,
+                args=((kernel_source, setting, index, launches, device_type, chosen_devices,
+                       workload, barrier, results),),
+            )
+            for index in range(count)
+        ]
+        for p in processes:
+            p.start()
+        per_device = dict(results.get() for _ in processes)
+        for p in processes:
+            p.join()
+        if None in per_device.values():
+            raise RuntimeError(f"Scaling run on {count} devices failed, see the worker errors")
+
+        total = sum(per_device.values())
+        single = single or total
+        report["devices"][count] = {
+            "keys_per_sec": total,
+            "per_device": [per_device[index] for index in range(count)],
+            "efficiency": total / (single * count),
+        }
+    return report
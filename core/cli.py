@@ -1,22 +1,42 @@
+import json
 import logging
 import multiprocessing
+import os
 import sys
-from multiprocessing.pool import Pool
 from typing import List, Optional, Tuple
 
 import click
 import pyopencl as cl
+from base58 import b58decode
 
+from config import PROGRAM_CACHE_DIR
+from core.benchmark import (
+    BENCHMARK_SEED,
+    REGRESSION_THRESHOLD,
+    SCALING_WORKLOAD,
+    compare_reports,
+    run_benchmark,
+    run_scaling,
+)
 from core.config import DEFAULT_ITERATION_BITS, HostSetting
+from core.engine import Result, SearchEngine
+from core.opencl.cache import build_program
+from core.opencl.profiles import load_device_profile, save_device_profile
 from core.opencl.manager import (
     get_all_gpu_devices,
     get_chosen_devices,
+    get_selected_gpu_devices,
 )
-from core.searcher import multi_gpu_init, save_result
-from core.utils.helpers import check_character, load_kernel_source
+from core.searcher import kernel_build_options
+from core.tuner import tune_device
+from core.utils.filters import pattern_error
+from core.utils.helpers import load_kernel_source
 
 logging.basicConfig(level="INFO", format="[%(levelname)s %(asctime)s] %(message)s")
 
+# found keys are appended here, one JSON object per line
+RESULTS_FILE = "keys.jsonl"
+
 
 @click.group()
 def cli():
@@ -37,12 +57,12 @@ def cli():
     default="",
     help="Public key ends with the indicated suffix.",
 )
-@click.option("--count", type=int, default=1, help="Count of pubkeys to generate.")
+@click.option("--count", type=int, default=1, help="Count of pubkeys to generate, over all prefixes.")
 @click.option(
     "--output-dir",
     type=click.Path(file_okay=False, dir_okay=True, writable=True),
     default="./",
-    help="Output directory.",
+    help=f"Output directory, keys are appended to {RESULTS_FILE} as they are found.",
 )
 @click.option(
     "--select-device/--no-select-device",
@@ -74,9 +94,11 @@ def search_pubkey(
         click.echo(ctx.get_help())
         sys.exit(1)
 
-    for prefix in starts_with:
-        check_character("starts_with", prefix)
-    check_character("ends_with", ends_with)
+    for prefix in starts_with or [""]:
+        error = pattern_error(prefix, ends_with, is_case_sensitive)
+        if error:
+            click.echo(f"Can't search {prefix!r}/{ends_with!r}: {error}")
+            sys.exit(1)
 
     chosen_devices: Optional[Tuple[int, List[int]]] = None
     if select_device:
@@ -84,6 +106,9 @@ def search_pubkey(
         gpu_counts = len(chosen_devices[1])
     else:
         gpu_counts = len(get_all_gpu_devices())
+    if gpu_counts == 0:
+        click.echo("No OpenCL GPUs found.")
+        sys.exit(1)
 
     logging.info(
         "Searching Solana pubkey with starts_with=(%s), ends_with=%s, is_case_sensitive=%s",
@@ -93,30 +118,228 @@ def search_pubkey(
     )
     logging.info(f"Using {gpu_counts} OpenCL device(s)")
 
+    setting = HostSetting(load_kernel_source(), iteration_bits)
+    engine = SearchEngine(setting, gpu_counts, chosen_devices)
+    engine.start()
+
+    # `count` copies of every prefix under distinct row ids; the first `count` keys found win
+    tasks = [
+        (row_id, prefix, ends_with, is_case_sensitive)
+        for row_id, prefix in enumerate(
+            prefix for prefix in dict.fromkeys(starts_with or [""]) for _ in range(count)
+        )
+    ]
+    patterns = {row_id: prefix for row_id, prefix, _, _ in tasks}
+
+    output_path = os.path.join(output_dir, RESULTS_FILE)
     result_count = 0
-    with multiprocessing.Manager() as manager:
-        with Pool(processes=gpu_counts) as pool:
-            kernel_source = load_kernel_source(
-                starts_with, ends_with, is_case_sensitive
-            )
-            lock = manager.Lock()
+    try:
+        engine.submit(tasks)
+        # the file holds private keys, readable by the owner only
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        with os.fdopen(fd, "a") as f:
             while result_count < count:
-                stop_flag = manager.Value("i", 0)
-                results = pool.starmap(
-                    multi_gpu_init,
-                    [
-                        (
-                            x,
-                            HostSetting(kernel_source, iteration_bits),
-                            gpu_counts,
-                            stop_flag,
-                            lock,
-                            chosen_devices,
-                        )
-                        for x in range(gpu_counts)
-                    ],
-                )
-                result_count += save_result(results, output_dir)
+                result = engine.get()
+                prefix = patterns[result.row_id]
+                result_count += 1
+
+                f.write(json.dumps(result_record(result, prefix, ends_with)) + "\n")
+                f.flush()
+                logging.info(f"[{result_count}/{count}] {result.address} -> {output_path}")
+    except RuntimeError as e:
+        logging.error(f"Search stopped after {result_count}/{count} key(s): {e}")
+        sys.exit(1)
+    finally:
+        engine.stop()
+
+
+def result_record(result: Result, prefix: str, suffix: str) -> dict:
+    """One JSONL line; `keypair` is the solana-keygen file format."""
+    return {
+        "pubkey": result.address,
+        "prefix": prefix,
+        "suffix": suffix,
+        "private_key": result.private_key,
+        "keypair": list(b58decode(result.private_key)),
+    }
+
+
+@cli.command(context_settings={"show_default": True})
+@click.option(
+    "--select-device/--no-select-device",
+    default=False,
+    help="Select OpenCL device manually",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, dir_okay=True, writable=True),
+    default=PROGRAM_CACHE_DIR,
+    help="Program binary cache directory.",
+)
+def warm_cache(select_device, cache_dir):
+    """Compile the kernel for every device and store the binaries in the cache."""
+    if select_device:
+        devices = get_selected_gpu_devices(*get_chosen_devices())
+    else:
+        devices = get_all_gpu_devices()
+
+    kernel_source = load_kernel_source()
+    for device in devices:
+        # same build options as the Searcher, which applies the tuned profile first
+        setting = HostSetting(kernel_source, DEFAULT_ITERATION_BITS)
+        profile = load_device_profile(device)
+        if profile:
+            setting.apply_profile(profile)
+        context = cl.Context([device])
+        build_program(context, device, kernel_source, kernel_build_options(setting), cache_dir)
+        logging.info(f"Cached program for {device.name} ({device.driver_version})")
+
+
+@cli.command(context_settings={"show_default": True})
+@click.option(
+    "--select-device/--no-select-device",
+    default=False,
+    help="Select OpenCL device manually",
+)
+@click.option(
+    "--duration", type=float, default=3.0, help="Seconds measured per candidate."
+)
+def tune(select_device, duration):
+    """Sweep launch geometry per device and save the fastest profile."""
+    chosen_devices: Optional[Tuple[int, List[int]]] = None
+    if select_device:
+        chosen_devices = get_chosen_devices()
+        devices = get_selected_gpu_devices(*chosen_devices)
+    else:
+        devices = get_all_gpu_devices()
+
+    kernel_source = load_kernel_source()
+    defaults = HostSetting(kernel_source, DEFAULT_ITERATION_BITS, use_profile=False)
+    base_profile = {
+        "iteration_bits": defaults.iteration_bits,
+        "local_work_size": defaults.local_work_size,
+        "inversion_batch": defaults.inversion_batch,
+        "keys_per_item": defaults.keys_per_item,
+    }
+
+    for index, device in enumerate(devices):
+        logging.info(f"Tuning {device.name} ({device.driver_version})")
+        profile = tune_device(kernel_source, index, base_profile, duration, chosen_devices)
+        save_device_profile(device, profile)
+        logging.info(f"Saved profile for {device.name}: {profile}")
+
+
+DEVICE_TYPES = {
+    "gpu": cl.device_type.GPU,
+    "cpu": cl.device_type.CPU,
+    "all": cl.device_type.ALL,
+}
+
+
+@cli.command(context_settings={"show_default": True})
+@click.option(
+    "--device-type",
+    type=click.Choice(list(DEVICE_TYPES)),
+    default="gpu",
+    help="OpenCL device type, use cpu for pocl on machines without GPUs.",
+)
+@click.option("--device-index", type=int, default=0, help="Device index within the type.")
+@click.option(
+    "--iteration-bits",
+    type=int,
+    default=DEFAULT_ITERATION_BITS,
+    help="Iteration bits, lower it on CPU devices.",
+)
+@click.option("--launches", type=int, default=20, help="Measured launches per workload.")
+@click.option(
+    "--workload",
+    type=str,
+    multiple=True,
+    help="Only run workloads whose name starts with this (e.g. prefix-10).",
+)
+@click.option(
+    "--use-profile/--no-use-profile",
+    default=False,
+    help="Apply the tuned device profile instead of the fixed settings.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the JSON report to this file instead of stdout.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Compare with a saved report and exit with 1 on regressions.",
+)
+@click.option(
+    "--threshold",
+    type=float,
+    default=REGRESSION_THRESHOLD,
+    help="Allowed keys/s loss against the baseline.",
+)
+@click.option(
+    "--scaling",
+    is_flag=True,
+    default=False,
+    help=f"Run {SCALING_WORKLOAD} on 1..N devices at once and report aggregate keys/s.",
+)
+def benchmark(
+    device_type,
+    device_index,
+    iteration_bits,
+    launches,
+    workload,
+    use_profile,
+    output,
+    baseline,
+    threshold,
+    scaling,
+):
+    """Run fixed-seed search workloads and report throughput as JSON."""
+    kernel_source = load_kernel_source()
+    setting = HostSetting(
+        kernel_source, iteration_bits, use_profile=use_profile, fixed_seed=BENCHMARK_SEED
+    )
+    if scaling:
+        report_json = json.dumps(
+            run_scaling(kernel_source, setting, launches, DEVICE_TYPES[device_type]), indent=2
+        )
+        if output:
+            with open(output, "w") as f:
+                f.write(report_json)
+        else:
+            click.echo(report_json)
+        return
+
+    report = run_benchmark(
+        kernel_source,
+        setting,
+        device_index,
+        launches,
+        DEVICE_TYPES[device_type],
+        only=list(workload),
+    )
+
+    regressions = []
+    if baseline:
+        with open(baseline, "r") as f:
+            regressions = compare_reports(report, json.load(f), threshold)
+        report["regressions"] = regressions
+
+    report_json = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(report_json)
+    else:
+        click.echo(report_json)
+
+    for line in regressions:
+        logging.error(f"Regression: {line}")
+    if regressions:
+        sys.exit(1)
 
 
 @cli.command(context_settings={"show_default": True})
@@ -1,35 +1,90 @@
 import secrets
-from math import ceil
+from typing import Optional
 
 import numpy as np
 
-from config import DEFAULT_ITERATION_BITS, DEFAULT_LOCAL_WORK_SIZE
+from config import (
+    DEFAULT_HIT_CAPACITY,
+    DEFAULT_INVERSION_BATCH,
+    DEFAULT_ITERATION_BITS,
+    DEFAULT_KEYS_PER_ITEM,
+    DEFAULT_LOCAL_WORK_SIZE,
+    DEFAULT_PATTERN_CAPACITY,
+    DEFAULT_PIPELINE_DEPTH,
+)
+
+# the kernel xors a 64-bit key counter into the last bytes of the seed
+SEED_COUNTER_BYTES = 8
+SEED_COUNTER_BITS = SEED_COUNTER_BYTES * 8
+# the device id sits right before the counter, so devices sharing a base seed
+# still search disjoint keyspaces
+SEED_DEVICE_BYTES = 2
 
 
 class HostSetting:
-    def __init__(self, kernel_source: str, iteration_bits: int):
+    def __init__(
+        self,
+        kernel_source: str,
+        iteration_bits: int,
+        hit_capacity: int = DEFAULT_HIT_CAPACITY,
+        inversion_batch: int = DEFAULT_INVERSION_BATCH,
+        keys_per_item: int = DEFAULT_KEYS_PER_ITEM,
+        pipeline_depth: int = DEFAULT_PIPELINE_DEPTH,
+        local_work_size: int = DEFAULT_LOCAL_WORK_SIZE,
+        pattern_capacity: int = DEFAULT_PATTERN_CAPACITY,
+        use_profile: bool = True,
+        fixed_seed: Optional[bytes] = None,
+    ):
         self.iteration_bits = iteration_bits
-        # iteration_bytes 为需要被迭代覆盖的字节数（向上取整）
-        self.iteration_bytes = np.ubyte(ceil(iteration_bits / 8))
         self.global_work_size = 1 << iteration_bits
-        self.local_work_size = DEFAULT_LOCAL_WORK_SIZE
+        self.local_work_size = local_work_size
+        # 单次启动最多可回传的命中数
+        self.hit_capacity = hit_capacity
+        # 每个 work item 共用一次求逆的密钥数
+        self.inversion_batch = inversion_batch
+        # 每个 work item 在一次启动中循环处理的密钥数
+        self.keys_per_item = keys_per_item
+        # 同时排队在设备上的启动数
+        self.pipeline_depth = max(1, pipeline_depth)
+        # 设备端模式表的槽位数, 搜索进行中可随时增删模式
+        self.pattern_capacity = pattern_capacity
+        # Searcher 启动时是否加载该设备的调优结果 (tune 命令)
+        self.use_profile = use_profile
+        # 固定种子, 仅用于可复现的基准测试
+        self.fixed_seed = fixed_seed
         self.kernel_source = kernel_source
+        self.validate()
         self.key32 = self.generate_key32()
 
-    def generate_key32(self) -> np.ndarray:
-        token_bytes = secrets.token_bytes(
-            32 - int(self.iteration_bytes)
-        ) + b"\x00" * int(self.iteration_bytes)
+    def validate(self) -> None:
+        if self.inversion_batch < 1 or self.inversion_batch & (self.inversion_batch - 1):
+            raise ValueError("inversion_batch must be a power of two")
+        if self.keys_per_item < self.inversion_batch or self.keys_per_item & (self.keys_per_item - 1):
+            raise ValueError("keys_per_item must be a power of two and at least inversion_batch")
+        if not 0 < self.iteration_bits < SEED_COUNTER_BITS:
+            raise ValueError(f"iteration_bits must be between 1 and {SEED_COUNTER_BITS - 1}")
+
+    def apply_profile(self, profile: dict) -> None:
+        """Override launch geometry with a tuned device profile."""
+        self.iteration_bits = profile.get("iteration_bits", self.iteration_bits)
+        self.global_work_size = 1 << self.iteration_bits
+        self.local_work_size = profile.get("local_work_size", self.local_work_size)
+        self.inversion_batch = profile.get("inversion_batch", self.inversion_batch)
+        self.keys_per_item = profile.get("keys_per_item", self.keys_per_item)
+        self.validate()
+
+    def generate_key32(self, device_id: int = 0) -> np.ndarray:
+        # 末尾 8 字节留给设备端的 64 位计数器: (launch_counter << iteration_bits) + 密钥序号
+        # 计数器前 2 字节是设备号, 不同设备的密钥空间互不重叠
+        random_length = 32 - SEED_COUNTER_BYTES - SEED_DEVICE_BYTES
+        if self.fixed_seed is not None:
+            random_bytes = self.fixed_seed[:random_length].ljust(random_length, b"\x00")
+        else:
+            random_bytes = secrets.token_bytes(random_length)
+        token_bytes = (
+            random_bytes
+            + device_id.to_bytes(SEED_DEVICE_BYTES, "big")
+            + b"\x00" * SEED_COUNTER_BYTES
+        )
         key32 = np.array(list(token_bytes), dtype=np.ubyte)
         return key32
-
-    def increase_key32(self) -> None:
-        current_number = int(bytes(self.key32).hex(), 16)
-        next_number = current_number + (1 << self.iteration_bits)
-        new_key32 = np.array(list(next_number.to_bytes(32, "big")), dtype=np.ubyte)
-        carry_index = -int(self.iteration_bytes)
-        if (new_key32[carry_index] < self.key32[carry_index]) and new_key32[
-            carry_index
-        ] != 0:
-            new_key32[carry_index] = 0
-        self.key32[:] = new_key32
@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from base58 import b58encode
+from loguru import logger
+from nacl.bindings import crypto_sign_seed_keypair
+
+from core.config import SEED_COUNTER_BYTES
+from core.searcher import Hit
+from core.utils.filters import (
+    SUFFIX_RESIDUE_CHARS,
+    address_matches,
+    compile_prefix_ranges,
+    compile_suffix_residues,
+)
+
+# chunks per process and launch, keeps the pool busy when chunks finish unevenly
+CHUNKS_PER_PROCESS = 4
+
+
+def derive_keypair(seed: bytes) -> bytes:
+    """64-byte Solana secret key (seed + public key), as written by the kernel."""
+    public_key, _ = crypto_sign_seed_keypair(seed)
+    return seed + public_key
+
+
+def search_cpu_chunk(args) -> List[Tuple[int, bytes]]:
+    """Derive keys [start, end) of one launch and return (pair index, secret key) hits."""
+    base_seed, key_offset, start, end, compiled_pairs = args
+    seed_head = base_seed[: 32 - SEED_COUNTER_BYTES]
+    tail_modulus = 58 ** SUFFIX_RESIDUE_CHARS
+    found = set()
+    hits = []
+
+    for key_index in range(key_offset + start, key_offset + end):
+        seed = seed_head + key_index.to_bytes(SEED_COUNTER_BYTES, "big")
+        public_key, _ = crypto_sign_seed_keypair(seed)
+
+        key_head = int.from_bytes(public_key[:8], "big")
+        key_residue = int.from_bytes(public_key, "big") % tail_modulus
+        address = None
+
+        for pair_idx, (prefix, suffix, case_sensitive, ranges, modulus, residues) in enumerate(compiled_pairs):
+            if pair_idx in found:
+                continue
+            if ranges and not any(lo <= key_head <= hi for lo, hi in ranges):
+                continue
+            if modulus and key_residue % modulus not in residues:
+                continue
+
+            if address is None:
+                address = b58encode(public_key).decode()
+            if address_matches(address, prefix, suffix, case_sensitive):
+                found.add(pair_idx)
+                hits.append((pair_idx, seed + public_key))
+                break
+
+        if len(found) == len(compiled_pairs):
+            break
+
+    return hits
+
+
+class CpuSearcher:
+    """
+    Searcher replacement for hosts without OpenCL GPUs. Keys are derived with
+    libsodium across a process pool, using the same seed layout as the kernel,
+    and base58 encoding only runs on keys that pass the prefix range and suffix
+    residue filters.
+    """
+
+    def __init__(
+        self,
+        setting,
+        index: int = 0,
+        processes: Optional[int] = None,
+    ):
+        self.setting = setting
+        self.index = index
+        self.display_index = f"CPU{index}"
+        self.processes = processes or os.cpu_count() or 1
+        self.pool = multiprocessing.get_context("spawn").Pool(processes=self.processes)
+        self.pipeline_depth = 1
+        # pair -> compiled filters, same role as the GPU pattern table
+        self.patterns = {}
+        # pairs the last find() searched for, like Searcher.launch_pairs
+        self.launch_pairs: List[Tuple] = []
+        self.setting.key32 = self.setting.generate_key32(self.index)
+        self.launch_counter = 0
+        self.prev_time = None
+        self.keys_per_sec = 0.0
+        self.speed_measured = False
+        self.stage_times = {}
+
+    @property
+    def global_worker_size(self) -> int:
+        return self.setting.global_work_size // self.setting.keys_per_item
+
+    @property
+    def prefix_suffix_pairs(self) -> List[Tuple]:
+        return list(self.patterns)
+
+    @property
+    def pattern_slots(self) -> dict:
+        # pair -> compiled filters, keyed like Searcher.pattern_slots
+        return self.patterns
+
+    @property
+    def free_slots(self) -> int:
+        return self.setting.pattern_capacity - len(self.patterns)
+
+    def drain(self):
+        pass
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def add_patterns(self, prefix_suffix_pairs: List[Tuple[str, str, str]], case_sensitive: Sequence[bool]):
+        params_start = time.time()
+        for pair, pair_case_sensitive in zip(prefix_suffix_pairs, case_sensitive):
+            if pair in self.patterns:
+                continue
+            if not self.free_slots:
+                raise ValueError(f"pattern table is full ({self.setting.pattern_capacity} slots)")
+            _, prefix, suffix = pair
+            modulus, residues = compile_suffix_residues(suffix, pair_case_sensitive)
+            self.patterns[pair] = (
+                prefix,
+                suffix,
+                pair_case_sensitive,
+                compile_prefix_ranges(prefix, pair_case_sensitive),
+                modulus,
+                frozenset(residues),
+            )
+        self.stage_times["params"] = time.time() - params_start
+
+    def remove_patterns(self, prefix_suffix_pairs: List[Tuple[str, str, str]]):
+        for pair in prefix_suffix_pairs:
+            self.patterns.pop(pair, None)
+
+    def set_search_params_batch(
+        self, prefix_suffix_pairs: List[Tuple[str, str, str]], case_sensitive: Sequence[bool]
+    ):
+        self.patterns = {}
+        self.add_patterns(prefix_suffix_pairs, case_sensitive)
+        self.setting.key32 = self.setting.generate_key32(self.index)
+        self.launch_counter = 0
+
+    def find(self, log_stats: bool = True):
+        start_time = time.time()
+
+        keys_per_launch = self.setting.global_work_size
+        key_offset = self.launch_counter << self.setting.iteration_bits
+        self.launch_counter += 1
+
+        chunk_count = self.processes * CHUNKS_PER_PROCESS
+        chunk_size = -(-keys_per_launch // chunk_count)
+        base_seed = bytes(self.setting.key32)
+        pairs = list(self.patterns)
+        self.launch_pairs = pairs
+        compiled_pairs = list(self.patterns.values())
+        tasks = [
+            (base_seed, key_offset, start, min(start + chunk_size, keys_per_launch), compiled_pairs)
+            for start in range(0, keys_per_launch, chunk_size)
+        ]
+
+        found = set()
+        results = []
+        for chunk_hits in self.pool.imap_unordered(search_cpu_chunk, tasks):
+            for pair_idx, secret_key in chunk_hits:
+                # same contract as the kernel: one hit per pair, at most hit_capacity
+                if pair_idx in found or len(results) >= self.setting.hit_capacity:
+                    continue
+                found.add(pair_idx)
+                results.append(
+                    Hit(pair_idx, len(b58encode(secret_key[32:])), secret_key, pairs[pair_idx])
+                )
+
+        self.prev_time = time.time() - start_time
+        self.stage_times["wait"] = self.prev_time
+        self.keys_per_sec = keys_per_launch / max(self.prev_time, 1e-9)
+        self.speed_measured = True
+
+        if log_stats:
+            logger.info(
+                f"{self.display_index} Speed: {self.keys_per_sec / 1e6:.2f} MH/s"
+            )
+
+        return results
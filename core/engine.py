@@ -0,0 +1,119 @@
+import multiprocessing
+import queue
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from core.config import HostSetting
+from core.gpu_worker import multi_gpu_worker
+from core.metrics import Metrics
+from core.scheduler import Scheduler
+
+from config import (
+    ESTIMATE_GPU_KEYS_PER_SEC,
+    REBALANCE_AFTER,
+    SCHEDULER_BATCH_ATTEMPTS,
+    SUBCHUNK_MAX,
+)
+
+# seconds a worker gets to finish its launches on stop before it is terminated
+STOP_TIMEOUT = 10
+# how often a waiting `get` checks that the workers are still running
+ALIVE_CHECK_INTERVAL = 1.0
+
+
+class Result(NamedTuple):
+    row_id: object
+    # None when the task was given up, `reason` says why
+    address: Optional[str]
+    private_key: Optional[str]
+    reason: Optional[str] = None
+
+
+class SearchEngine:
+    """
+    Long-lived search workers for clients outside the server: one process
+    per OpenCL device, started once and fed through a Scheduler. Tasks are
+    (row_id, prefix, suffix, case_sensitive) tuples with unique row ids;
+    each task yields one Result on `results`, in the order they are found.
+    """
+
+    def __init__(
+        self,
+        setting: HostSetting,
+        device_count: int,
+        chosen_devices: Optional[Tuple[int, List[int]]] = None,
+        attempt_budget: float = float("inf"),
+        metrics: Optional[Metrics] = None,
+    ):
+        self.events = multiprocessing.Queue()
+        self.task_queues = [multiprocessing.Queue() for _ in range(device_count)]
+        self.processes = [
+            multiprocessing.Process(
+                target=multi_gpu_worker,
+                args=(index, setting, task_queue, self.events, chosen_devices),
+                daemon=True,
+            )
+            for index, task_queue in enumerate(self.task_queues)
+        ]
+        self.results: "queue.Queue[Result]" = queue.Queue()
+        self.scheduler = Scheduler(
+            self.task_queues,
+            self.events,
+            batch_size=SUBCHUNK_MAX,
+            batch_attempts=SCHEDULER_BATCH_ATTEMPTS,
+            rebalance_after=REBALANCE_AFTER,
+            default_speeds=[ESTIMATE_GPU_KEYS_PER_SEC] * device_count,
+            on_found=self.on_found,
+            on_failed=self.on_failed,
+            attempt_budget=attempt_budget,
+            metrics=metrics or Metrics(),
+        )
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+        self.scheduler.start()
+
+    def on_found(self, row_id, address: str, private_key: str):
+        # вызывается под блокировкой планировщика: только кладём в очередь
+        self.results.put(Result(row_id, address, private_key))
+
+    def on_failed(self, row_id, reason: str):
+        self.results.put(Result(row_id, None, None, reason))
+
+    def submit(self, tasks: List[Tuple]):
+        self.scheduler.add(tasks)
+
+    def cancel(self, row_ids: List):
+        self.scheduler.cancel(row_ids)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Result]:
+        """
+        Next result, None after `timeout` seconds without one. Raises
+        RuntimeError when a worker process has died, instead of waiting for
+        results that will never come.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = ALIVE_CHECK_INTERVAL if deadline is None else min(ALIVE_CHECK_INTERVAL, deadline - time.time())
+            try:
+                return self.results.get(timeout=max(0.0, wait))
+            except queue.Empty:
+                pass
+            dead = [index for index, p in enumerate(self.processes) if not p.is_alive()]
+            if dead:
+                raise RuntimeError(f"Search worker(s) {dead} exited, see the worker log")
+            if deadline is not None and time.time() >= deadline:
+                return None
+
+    def stop(self):
+        self.scheduler.stop()
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for p in self.processes:
+            p.join(STOP_TIMEOUT)
+            if p.is_alive():
+                logger.warning(f"Worker {p.pid} did not stop in {STOP_TIMEOUT}s, terminating")
+                p.terminate()
@@ -0,0 +1,87 @@
+from typing import Optional
+
+from core.utils.filters import (
+    ADDRESS_LENGTHS,
+    BASE58_ALPHABET,
+    KEY_BITS,
+    case_variants,
+    fold_case,
+    merge_ranges,
+    prefix_range,
+)
+
+# past this many case variants the rest of the prefix is estimated per character
+MAX_EXACT_VARIANTS = 4096
+
+
+def variant_count(character: str, case_sensitive: bool) -> int:
+    if case_sensitive:
+        return 1
+    folded = fold_case(character)
+    return sum(1 for c in BASE58_ALPHABET if fold_case(c) == folded)
+
+
+def character_probability(character: str, case_sensitive: bool) -> float:
+    return variant_count(character, case_sensitive) / 58
+
+
+def prefix_probability(prefix: str, case_sensitive: bool) -> float:
+    """
+    Share of public keys whose address starts with `prefix`. Measured on the
+    exact key ranges of every case variant for 43- and 44-character addresses,
+    so the skew of the leading character (most addresses have 44 characters
+    and start low in the alphabet) is accounted for.
+    """
+    if any(c not in BASE58_ALPHABET for c in prefix):
+        return 0.0
+
+    leading_ones = len(prefix) - len(prefix.lstrip("1"))
+    if leading_ones:
+        # every leading '1' is a zero byte
+        probability = 2.0 ** (-8 * leading_ones)
+        for character in prefix[leading_ones:]:
+            probability *= character_probability(character, case_sensitive)
+        return probability
+
+    exact = len(prefix)
+    variants = 1
+    for position, character in enumerate(prefix):
+        variants *= variant_count(character, case_sensitive)
+        if variants > MAX_EXACT_VARIANTS:
+            exact = position
+            break
+
+    ranges = []
+    for variant in case_variants(prefix[:exact], case_sensitive):
+        for address_length in ADDRESS_LENGTHS:
+            lo, hi = prefix_range(variant, address_length)
+            if lo <= hi:
+                ranges.append((lo, hi))
+    probability = sum(hi - lo + 1 for lo, hi in merge_ranges(ranges)) / (1 << KEY_BITS)
+    for character in prefix[exact:]:
+        probability *= character_probability(character, case_sensitive)
+    return probability
+
+
+def suffix_probability(suffix: str, case_sensitive: bool) -> float:
+    """Share of public keys whose address ends with `suffix`; the key modulo 58**k is uniform."""
+    if any(c not in BASE58_ALPHABET for c in suffix):
+        return 0.0
+    probability = 1.0
+    for character in suffix:
+        probability *= character_probability(character, case_sensitive)
+    return probability
+
+
+def expected_attempts(prefix: str, suffix: str, case_sensitive: bool) -> float:
+    """Expected number of keys to derive before one matches, inf when no address can match."""
+    probability = prefix_probability(prefix, case_sensitive) * suffix_probability(suffix, case_sensitive)
+    if probability == 0:
+        return float("inf")
+    return 1 / probability
+
+
+def estimate_seconds(attempts: float, keys_per_sec: float) -> Optional[float]:
+    if keys_per_sec <= 0:
+        return None
+    return attempts / keys_per_sec
@@ -1,149 +1,203 @@
 import multiprocessing
-import base58
+import queue
 import time
 
 from loguru import logger
 
 from typing import List, Optional, Tuple
 from core.config import HostSetting
-from base58 import b58encode
 
+from core.cpu_searcher import CpuSearcher
 from core.searcher import Searcher
-from core.postgres import Postgres
+from core.scheduler import MSG_ATTEMPTS, MSG_CANCEL, MSG_FOUND, MSG_IDLE, MSG_METRICS, MSG_SPEED
+from core.profiling import make_tracer, trace
+from core.verifier import HitVerifier
 
-from dotenv import load_dotenv
-
-from config import DB_CONFIG, MAX_FIND_STEPS
-
-load_dotenv()
+from config import PROFILE_DIR
 
 
 def multi_gpu_worker(
     index: int,
     setting: HostSetting,
     task_queue: multiprocessing.Queue,
+    events: multiprocessing.Queue,
     chosen_devices: Optional[Tuple[int, List[int]]] = None,
+    backend: str = "gpu",
 ):
     try:
-        postgres = Postgres(
-            db_config=DB_CONFIG
-        )
-
-        searcher = Searcher(
-            kernel_source=setting.kernel_source,
-            index=index,
-            setting=setting,
-            chosen_devices=chosen_devices,
-        )
+        # профилирование включается через PROFILE_DIR
+        tracer = make_tracer(f"worker{index}")
+
+        if backend == "cpu":
+            searcher = CpuSearcher(setting=setting, index=index)
+        else:
+            searcher = Searcher(
+                kernel_source=setting.kernel_source,
+                index=index,
+                setting=setting,
+                chosen_devices=chosen_devices,
+                tracer=tracer,
+            )
+
+        # (row_id, prefix, suffix) -> case_sensitive, для всех пар воркера
+        case_flags = {}
+
+        def on_verified(pair, address, private_key):
+            row_id = pair[0]
+            logger.info(f"FOUND = Address: {address} => row_id: {row_id}")
+            case_flags.pop(pair, None)
+
+            # в БД пишет сервер (ResultWriter), воркер не ждёт базу
+            events.put((MSG_FOUND, index, row_id, address, private_key))
+
+        # проверка найденных ключей и запись в БД идут в отдельном потоке
+        verifier = HitVerifier(on_verified)
+        verifier.start()
+
+        # пары, которым ещё не хватило слота в таблице
+        backlog = []
+        # row_id -> ключей перебрано с прошлого отчёта
+        searched = {}
+        # счётчики для метрик с прошлого отчёта
+        counters = {"keys": 0, "launches": 0, "hits": 0}
+        device_name = "cpu" if backend == "cpu" else searcher.device.name
+        stopping = False
+        asked = False
+        last_report = 0.0
 
         while True:
-            task_batch = task_queue.get()
-            if task_batch is None:
-                break
-
-            logger.info(f"Batch: {[f'{f[1]}__{f[2]}' for f in task_batch]}")
-
-            # Convert to (prefix, suffix) -> row_id
-            task_map = {}
-            active_pairs = []
-            for row_id, prefix, suffix, case_sensitive in task_batch:
-                key = (row_id, prefix, suffix)
-                task_map[key] = (row_id, case_sensitive)
-                active_pairs.append(key)
-
-            while active_pairs:
-                logger.info(f"🔁 Left find pairs: {len(active_pairs)}")
-
-                prefix_suffix_pairs = active_pairs
-                case_sensitive = any(
-                    task_map[pair][1] for pair in prefix_suffix_pairs)  # True если хоть одна пара чувствительна
-
-                searcher.set_search_params_batch(prefix_suffix_pairs, case_sensitive)
-                #find_steps = 0
-                #row_id = prefix_suffix_pairs[0][0]
-
-                i = 0
-                st = time.time()
-                while True:
-                    result = searcher.find(i == 0)
-                    found_something = False
-                    #find_steps += 1
-
-                    if result:
-                        results = get_results([r for r in result])
-
-                        logger.info(f"Results cnt: {len(results)}")
-
-                        for data in results:
-                            address, private_key = data
-                            found_pair = None
-
-                            for row_id, prefix, suffix in active_pairs:
-                                if address.startswith(prefix) and address.endswith(suffix):
-                                    found_pair = (row_id, prefix, suffix)
-                                    break
-
-                            if found_pair is None:
-                                continue
-
-                            row_id, _ = task_map[found_pair]
-                            logger.info(f"FOUND = Address: {address} => row_id: {row_id}")
-
-                            postgres.update(**{
-                                'row_id': row_id,
-                                'start_address': address,
-                                'private_address': private_key,
-                                'status': 'success'
-                            })
-
-                            active_pairs.remove(found_pair)
-                            found_something = True
-                            break
-
-                    """
-                    if find_steps >= MAX_FIND_STEPS:
-                        postgres.update(**{
-                            'row_id': row_id,
-                            'status': 'error',
-                            'message': 'key not found'
-                        })
-                        break
-                    """
-
-                    if found_something:
-                        break
-                    else:
-                        time.sleep(0.01)  # предотвращение tight loop
-
-                    if time.time() - st > 1:
-                        i = 0
-                        st = time.time()
+            if not searcher.prefix_suffix_pairs and not backlog:
+                # пары, чьи ключи не прошли проверку, ищем заново
+                with trace(tracer, "wait for verifier"):
+                    verifier.tasks.join()
+                backlog.extend(take_rejected(verifier, case_flags))
+
+            messages = []
+            if not searcher.prefix_suffix_pairs and not backlog:
+                if stopping:
+                    break
+                # простой: дожидаемся запусков, иначе первый замер после простоя включит всё ожидание
+                searcher.drain()
+                if not asked:
+                    # сообщаем планировщику, что свободны
+                    events.put((MSG_IDLE, index))
+                    asked = True
+                with trace(tracer, "wait for tasks"):
+                    messages.append(task_queue.get())
+
+            # новые партии и отмены забираем без ожидания, перед каждым запуском
+            with trace(tracer, "read queue"):
+                messages.extend(drain_queue(task_queue))
+                for message in messages:
+                    if message is None:
+                        # остановка: дорабатываем текущие пары
+                        stopping = True
+                    elif message[0] == MSG_CANCEL:
+                        cancel_pairs(searcher, backlog, case_flags, message[1])
                     else:
-                        i += 1
-
-            logger.success("All pairs found!")
-
-        postgres.close()
+                        logger.info(f"Batch: {[f'{f[1]}__{f[2]}' for f in message]}")
+                        for row_id, prefix, suffix, case_sensitive in message:
+                            pair = (row_id, prefix, suffix)
+                            case_flags[pair] = case_sensitive
+                            backlog.append(pair)
+                        asked = False
+
+            with trace(tracer, "fill table"):
+                fill_table(searcher, backlog, case_flags)
+            if not searcher.prefix_suffix_pairs:
+                continue
+
+            if searcher.free_slots and not backlog and not asked and not stopping:
+                # в таблице есть место: новые строки подключатся к текущему поиску
+                events.put((MSG_IDLE, index))
+                asked = True
+
+            log_stats = time.time() - last_report > 1
+            with trace(tracer, "find"):
+                result = searcher.find(log_stats)
+            keys_per_launch = searcher.global_worker_size * searcher.setting.keys_per_item
+            # ключи засчитываем только парам, которые были в таблице у вернувшегося запуска
+            for row_id, _, _ in searcher.launch_pairs:
+                searched[row_id] = searched.get(row_id, 0) + keys_per_launch
+            counters["keys"] += keys_per_launch
+            counters["launches"] += 1
+            counters["hits"] += len(result)
+
+            # один запуск может закрыть сразу несколько пар
+            with trace(tracer, "handle hits"):
+                for hit in result:
+                    if hit.pair not in case_flags or hit.pair not in searcher.pattern_slots:
+                        # пару уже сняли, хит от запуска, поставленного раньше
+                        continue
+                    verifier.submit(hit.pair, case_flags[hit.pair], hit.secret_key)
+                    searcher.remove_patterns([hit.pair])
+
+            if log_stats:
+                # MSG_FOUND отданных хитов должен уйти раньше попыток, иначе бюджет снимет найденную строку
+                with trace(tracer, "wait for verifier"):
+                    verifier.tasks.join()
+                last_report = time.time()
+                # замер скорости для оценки ETA и перебранные ключи для бюджета попыток
+                if searcher.speed_measured:
+                    events.put((MSG_SPEED, index, searcher.keys_per_sec))
+                events.put((MSG_ATTEMPTS, index, searched))
+                events.put((MSG_METRICS, index, dict(
+                    counters,
+                    device=device_name,
+                    keys_per_sec=searcher.keys_per_sec,
+                    patterns=len(searcher.prefix_suffix_pairs),
+                    backlog=len(backlog),
+                )))
+                searched = {}
+                counters = {"keys": 0, "launches": 0, "hits": 0}
+
+            backlog.extend(take_rejected(verifier, case_flags))
+            if tracer is not None:
+                tracer.write_every()
+
+        logger.success(f"Worker {index}: all pairs found, stopping")
+        verifier.stop()
+        if tracer is not None:
+            tracer.write(PROFILE_DIR)
 
     except Exception as e:
         logger.exception(e)
 
 
-def get_results(outputs):
-    results = []
-    for output in outputs:
-        if not output[0]:
-            continue
-        seed_list = output[1]  # это list[int], длиной 32
-        private_key_bytes = bytes(seed_list)
+def drain_queue(task_queue: multiprocessing.Queue) -> list:
+    messages = []
+    while True:
+        try:
+            messages.append(task_queue.get_nowait())
+        except queue.Empty:
+            return messages
 
-        expected_pubkey = private_key_bytes[32:]
-        public_key_bytes = expected_pubkey
 
-        solana_address = base58.b58encode(public_key_bytes).decode()
-        private_key = b58encode(private_key_bytes).decode()
+def take_rejected(verifier: HitVerifier, case_flags: dict) -> list:
+    """Pairs whose hit failed verification and that were not cancelled meanwhile."""
+    return [pair for pair in verifier.take_rejected() if pair in case_flags]
 
-        results.append([solana_address, private_key])
-
-    return results
 
+def fill_table(searcher, backlog: list, case_flags: dict):
+    """Move backlog pairs into free pattern table slots."""
+    while backlog and searcher.free_slots:
+        pair = backlog.pop(0)
+        if pair not in case_flags:
+            # пару отменили, пока она ждала слота
+            continue
+        try:
+            searcher.add_patterns([pair], [case_flags[pair]])
+        except ValueError as e:
+            logger.error(f"Skip {pair}: {e}")
+            case_flags.pop(pair, None)
+
+
+def cancel_pairs(searcher, backlog: list, case_flags: dict, row_ids: list):
+    """Drop pairs the scheduler reports as found by another worker."""
+    row_ids = set(row_ids)
+    cancelled = [pair for pair in list(case_flags) if pair[0] in row_ids]
+    searcher.remove_patterns(cancelled)
+    for pair in cancelled:
+        case_flags.pop(pair, None)
+        if pair in backlog:
+            backlog.remove(pair)
@@ -0,0 +1,152 @@
+import bisect
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+# upper bounds in seconds
+TIME_TO_RESULT_BUCKETS = [1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600]
+DB_WRITE_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def difficulty_label(attempts: float) -> str:
+    """Difficulty as the number of case-sensitive characters with the same odds."""
+    if math.isinf(attempts):
+        return "inf"
+    return str(max(0, round(math.log(max(attempts, 1), 58))))
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def lines(self, name: str, labels: Tuple[Tuple[str, str], ...]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + [math.inf], self.counts):
+            cumulative += count
+            le = "+Inf" if math.isinf(bound) else repr(float(bound))
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.total}")
+        lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """
+    In-memory registry of the server process. Workers send counter deltas and
+    gauges over the scheduler events queue; the scheduler and the result writer
+    record task outcomes and write latency directly. `render` returns the
+    Prometheus text exposition format.
+    """
+
+    COUNTERS = {
+        "solvanity_keys_total": "Keys derived per worker.",
+        "solvanity_launches_total": "Kernel launches (CPU chunks) per worker.",
+        "solvanity_hits_total": "Hits reported by the search backend per worker.",
+        "solvanity_tasks_total": "Tasks finished, by outcome.",
+    }
+    GAUGES = {
+        "solvanity_keys_per_second": "Last measured keys/s per worker.",
+        "solvanity_patterns_in_flight": "Patterns in the worker's pattern table.",
+        "solvanity_patterns_waiting": "Patterns a worker holds that wait for a table slot.",
+        "solvanity_tasks_pending": "Tasks in the scheduler pool not given to any worker.",
+        "solvanity_tasks_running": "Tasks given to at least one worker.",
+        "solvanity_stock_keys": "Pre-generated keys in stock, by pattern.",
+    }
+    HISTOGRAMS = {
+        "solvanity_time_to_result_seconds": "Seconds from dispatch to a found key, by difficulty.",
+        "solvanity_db_write_seconds": "Seconds per result batch written to the database.",
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: Dict[str, Dict[Tuple, float]] = {name: {} for name in {**self.COUNTERS, **self.GAUGES}}
+        self.histograms: Dict[str, Dict[Tuple, Histogram]] = {name: {} for name in self.HISTOGRAMS}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = self.values[name].get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = value
+
+    def observe(self, name: str, value: float, buckets: List[float], **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            if key not in self.histograms[name]:
+                self.histograms[name][key] = Histogram(buckets)
+            self.histograms[name][key].observe(value)
+
+    def record_worker(self, worker: int, report: dict):
+        """Apply one worker report: counter deltas since the last report and current gauges."""
+        labels = {"worker": str(worker), "device": report["device"]}
+        self.inc("solvanity_keys_total", report["keys"], **labels)
+        self.inc("solvanity_launches_total", report["launches"], **labels)
+        self.inc("solvanity_hits_total", report["hits"], **labels)
+        self.set("solvanity_keys_per_second", report["keys_per_sec"], **labels)
+        self.set("solvanity_patterns_in_flight", report["patterns"], **labels)
+        self.set("solvanity_patterns_waiting", report["backlog"], **labels)
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for kind, names in (("counter", self.COUNTERS), ("gauge", self.GAUGES)):
+                for name, help_text in names.items():
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for labels, value in sorted(self.values[name].items()):
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+            for name, help_text in self.HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    lines.extend(histogram.lines(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics: Metrics, host: str, port: int) -> ThreadingHTTPServer:
+    """Serve GET /metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import pyopencl as cl
+
+from config import PROGRAM_CACHE_DIR
+
+
+def program_cache_key(device: cl.Device, kernel_source: str, options: List[str]) -> str:
+    source_hash = hashlib.sha256(kernel_source.encode()).hexdigest()
+    key = "\n".join(
+        [
+            device.platform.name,
+            device.name,
+            device.driver_version,
+            " ".join(options),
+            source_hash,
+        ]
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # workers may build the same program concurrently, readers must never see a partial file
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def build_program(
+    context: cl.Context,
+    device: cl.Device,
+    kernel_source: str,
+    options: List[str],
+    cache_dir: Optional[str] = PROGRAM_CACHE_DIR,
+) -> cl.Program:
+    """
+    Build `kernel_source` for `device`, reusing a binary stored under `cache_dir`.
+    Entries are keyed by platform, device name, driver version, build options and
+    the source hash, so any change to them misses the cache. A binary the driver
+    refuses to load is removed and rebuilt from source.
+    """
+    if not cache_dir:
+        return cl.Program(context, kernel_source).build(options=options)
+
+    cache_path = Path(cache_dir)
+    binary_path = cache_path / f"{program_cache_key(device, kernel_source, options)}.bin"
+
+    if binary_path.exists():
+        try:
+            program = cl.Program(context, [device], [binary_path.read_bytes()])
+            return program.build(options=options)
+        except (cl.Error, OSError) as e:
+            logging.warning(f"Dropping stale program cache entry {binary_path.name}: {e}")
+            binary_path.unlink(missing_ok=True)
+
+    program = cl.Program(context, kernel_source).build(options=options)
+
+    try:
+        cache_path.mkdir(parents=True, exist_ok=True)
+        binary = program.get_info(cl.program_info.BINARIES)[0]
+        _write_atomic(binary_path, binary)
+    except OSError as e:
+        logging.warning(f"Can't write program cache entry {binary_path}: {e}")
+
+    return program
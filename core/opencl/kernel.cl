@@ -16,6 +16,26 @@ constant uchar SUFFIX[] = {};
 constant bool CASE_SENSITIVE = true;
 // DO NOT EDIT ABOVE THIS LINE -- END OF AUTO-GENERATED CODE
 
+// addr_len (1) + padding (3) + pair index (4, little endian) + seed (32) + public key (32),
+// must match HIT_RECORD_DTYPE in core/searcher.py
+#define HIT_RECORD_SIZE 72
+
+// per-pair stride of prefixes and suffixes, must match MAX_PATTERN_LENGTH in core/utils/filters.py
+#define MAX_PATTERN_LENGTH 44
+
+// per-pair stride of prefix_ranges, must match MAX_PREFIX_RANGES in core/utils/filters.py
+#define MAX_PREFIX_RANGES 16
+
+// per-pair stride of suffix_residues, must match MAX_SUFFIX_RESIDUES in core/utils/filters.py
+#define MAX_SUFFIX_RESIDUES 32
+
+// keys derived per work item sharing one field inversion, set with -D INVERSION_BATCH=K
+#ifndef INVERSION_BATCH
+#define INVERSION_BATCH 1
+#endif
+
+// patterns arrive as base58 digit indices, already folded by the host for
+// case-insensitive pairs, so only the address side is folded here
 #define ADJUST_INPUT_CASE(x, case_sensitive) \
 (case_sensitive ? (x) : \
     ((x) - ((x) > 32) * \
@@ -23,26 +43,6 @@ constant bool CASE_SENSITIVE = true;
         (24 + (((unsigned int) 67079168 >> ((x) & 31)) & 1))))
 
 
-constant uchar alphabet_indices[] = {
-  0, 0, 0, 0, 0, 0, 0, 0,
-  0, 0, 0, 0, 0, 0, 0, 0,
-  0, 0, 0, 0, 0, 0, 0, 0,
-  0, 0, 0, 0, 0, 0, 0, 0,
-  0, 0, 0, 0, 0, 0, 0, 0,
-  0, 0, 0, 0, 0, 0, 0, 0,
-  0, 0, 1, 2, 3, 4, 5, 6,
-  7, 8, 0, 0, 0, 0, 0, 0,
-  0, 9, 10, 11, 12, 13, 14, 15,
-  16, 0, 17, 18, 19, 20, 21, 0,
-  22, 23, 24, 25, 26, 27, 28, 29,
-  30, 31, 32, 0, 0, 0, 0, 0,
-  0, 33, 34, 35, 36, 37, 38, 39,
-  40, 41, 42, 43, 0, 44, 45, 46,
-  47, 48, 49, 50, 51, 52, 53, 54,
-  55, 56, 57, 0, 0, 0, 0, 0
-};
-
-
 /*
 r = p + q
 */
@@ -3322,17 +3322,22 @@ void ge_p3_to_p2(ge_p2 *r, const ge_p3 *p) {
 }
 
 inline __attribute__((always_inline))
-void ge_p3_tobytes(unsigned char *s, const ge_p3 *h) {
-  fe recip;
+void ge_p3_tobytes_recip(unsigned char *s, const ge_p3 *h, const __generic fe recip) {
   fe x;
   fe y;
-  fe_invert(recip, h->Z);
   fe_mul(x, h->X, recip);
   fe_mul(y, h->Y, recip);
   fe_tobytes(s, y);
   s[31] ^= fe_isnegative(x) << 7;
 }
 
+inline __attribute__((always_inline))
+void ge_p3_tobytes(unsigned char *s, const ge_p3 *h) {
+  fe recip;
+  fe_invert(recip, h->Z);
+  ge_p3_tobytes_recip(s, h, recip);
+}
+
 inline __attribute__((always_inline))
 void ge_madd(ge_p1p1 *r, const ge_p3 *p, const ge_precomp *q) {
   fe t0;
@@ -3629,6 +3634,18 @@ void sha512(const unsigned char *message, unsigned char *out) {
   COPY_REVERSED_ENDIAN_U64(out,S,7)
 }
 
+inline __attribute__((always_inline))
+void ed25519_derive_point(ge_p3 *A, const unsigned char *seed) {
+  unsigned char private_key[64];
+
+  sha512(seed, private_key);
+  private_key[0] &= 248;
+  private_key[31] &= 63;
+  private_key[31] |= 64;
+
+  ge_scalarmult_base(A, private_key);
+}
+
 inline __attribute__((always_inline))
 void ed25519_create_keypair(unsigned char *public_key,
                             unsigned char *private_key,
@@ -3644,6 +3661,32 @@ void ed25519_create_keypair(unsigned char *public_key,
   ge_p3_tobytes(public_key, &A);
 }
 
+/*
+Montgomery's simultaneous inversion: one fe_invert for INVERSION_BATCH points,
+paid for with 3 * (INVERSION_BATCH - 1) extra multiplications.
+*/
+inline __attribute__((always_inline))
+void ge_p3_batch_tobytes(unsigned char public_keys[INVERSION_BATCH][32],
+                         const ge_p3 points[INVERSION_BATCH]) {
+  fe products[INVERSION_BATCH];
+  fe inv;
+  fe recip;
+
+  fe_copy(products[0], points[0].Z);
+  for (int j = 1; j < INVERSION_BATCH; j++) {
+    fe_mul(products[j], products[j - 1], points[j].Z);
+  }
+
+  fe_invert(inv, products[INVERSION_BATCH - 1]);
+
+  for (int j = INVERSION_BATCH - 1; j > 0; j--) {
+    fe_mul(recip, inv, products[j - 1]);
+    fe_mul(inv, inv, points[j].Z);
+    ge_p3_tobytes_recip(public_keys[j], &points[j], recip);
+  }
+  ge_p3_tobytes_recip(public_keys[0], &points[0], inv);
+}
+
 inline __attribute__((always_inline))
 static uchar * base58_encode(uchar *in, size_t *out_len, uchar *out) {
   unsigned int binary[8];
@@ -3734,85 +3777,167 @@ static uchar * base58_encode(uchar *in, size_t *out_len, uchar *out) {
   return out + skip;
 }
 
-__kernel void generate_pubkey(
-    __constant uchar *seed,
-    __global uchar *out,
-    __global uchar *occupied_bytes,
-    __global uchar *group_offset,
+/*
+Public key modulo 58^5, i.e. the last five base58 digits of its address.
+*/
+inline __attribute__((always_inline))
+uint base58_tail_residue(const uchar *public_key) {
+  ulong residue = 0;
 
-    __constant uchar *prefixes,
-    __constant uchar *prefix_lengths,
-    __constant uchar *suffixes,
-    __constant uchar *suffix_lengths,
-    const uint pair_count,
+  #pragma unroll
+  for (int i = 0; i < 8; i++) {
+    uint word = as_uint(((const uchar4 *)public_key)[i].wzyx);
+    residue = ((residue << 32) | word) % 656356768UL;
+  }
+  return (uint) residue;
+}
 
-    const uchar case_sensitive,
+/*
+Cheap pre-filter before base58_encode. A pair stays a candidate when the top
+64 bits of the key fall into one of its prefix ranges (compile_prefix_ranges)
+and the key matches one of its suffix residues (compile_suffix_residues).
+Pairs without ranges or residues can't be filtered and always pass.
+*/
+inline __attribute__((always_inline))
+bool pair_filters_match(const uchar *public_key,
+                        __global const ulong *prefix_ranges,
+                        __constant uchar *prefix_range_counts,
+                        __constant uint *suffix_moduli,
+                        __global const uint *suffix_residues,
+                        __constant uchar *suffix_residue_counts,
+                        __constant uchar *active,
+                        const uint pair_count) {
+  ulong key_head = 0;
 
-    __global uint *out_index
-) {
-    uchar public_key[32] __attribute__((aligned(4)));
-    uchar private_key[64];
-    uchar key_base[32];
+  #pragma unroll
+  for (int i = 0; i < 8; i++) {
+    key_head = (key_head << 8) | public_key[i];
+  }
 
-    const int global_id = (*group_offset) * get_global_size(0) + get_global_id(0);
+  uint key_residue = base58_tail_residue(public_key);
 
-    if (*out_index != 0) {
-        return;
+  for (uint pair_idx = 0; pair_idx < pair_count; pair_idx++) {
+    if (!active[pair_idx]) {
+      continue;
     }
 
-    for (uint i = 0; i < 32; i++) {
-        key_base[i] = seed[i];
+    uchar range_count = prefix_range_counts[pair_idx];
+    bool prefix_ok = range_count == 0;
+
+    __global const ulong *ranges = prefix_ranges + pair_idx * MAX_PREFIX_RANGES * 2;
+    for (uchar r = 0; r < range_count; r++) {
+      if (key_head >= ranges[2 * r] && key_head <= ranges[2 * r + 1]) {
+        prefix_ok = true;
+        break;
+      }
+    }
+
+    if (!prefix_ok) {
+      continue;
+    }
+
+    uint modulus = suffix_moduli[pair_idx];
+    if (modulus == 0) {
+      return true;
     }
 
-    for (uint i = 0; i < *occupied_bytes; i++) {
-        key_base[31 - i] ^= ((global_id >> (i * 8)) & 0xFF);
+    uint tail = key_residue % modulus;
+    __global const uint *residues = suffix_residues + pair_idx * MAX_SUFFIX_RESIDUES;
+    uchar residue_count = suffix_residue_counts[pair_idx];
+    for (uchar r = 0; r < residue_count; r++) {
+      if (tail == residues[r]) {
+        return true;
+      }
     }
+  }
+  return false;
+}
 
-    ed25519_create_keypair(public_key, private_key, key_base);
+/*
+Filter, encode and compare one derived key against every pair, and record it
+in the first free hit slot if it matches.
+*/
+inline __attribute__((always_inline))
+void match_and_record(const uchar *public_key,
+                      const uchar *key_base,
+                      __global uchar *out,
+                      __global const uchar *prefixes,
+                      __constant uchar *prefix_lengths,
+                      __global const uchar *suffixes,
+                      __constant uchar *suffix_lengths,
+                      const uint pair_count,
+                      __constant uchar *case_sensitive,
+                      __global uint *out_index,
+                      const uint out_capacity,
+                      __global uint *out_overflow,
+                      __global uint *pair_found,
+                      __global const ulong *prefix_ranges,
+                      __constant uchar *prefix_range_counts,
+                      __constant uint *suffix_moduli,
+                      __global const uint *suffix_residues,
+                      __constant uchar *suffix_residue_counts,
+                      __constant uchar *active) {
+    if (!pair_filters_match(public_key, prefix_ranges, prefix_range_counts,
+                            suffix_moduli, suffix_residues, suffix_residue_counts, active, pair_count)) {
+        return;
+    }
 
     size_t addr_len;
     uchar addr_buffer[45] __attribute__((aligned(4)));
-    uchar *addr_raw = base58_encode(public_key, &addr_len, addr_buffer);
-
-    uint prefix_offset = 0;
-    uint suffix_offset = 0;
+    uchar *addr_raw = base58_encode((uchar *) public_key, &addr_len, addr_buffer);
 
     for (uint pair_idx = 0; pair_idx < pair_count; pair_idx++) {
+        if (!active[pair_idx]) {
+            continue;
+        }
+
+        const uint prefix_offset = pair_idx * MAX_PATTERN_LENGTH;
+        const uint suffix_offset = pair_idx * MAX_PATTERN_LENGTH;
         uchar pre_len = prefix_lengths[pair_idx];
         uchar suf_len = suffix_lengths[pair_idx];
+        uchar pair_case_sensitive = case_sensitive[pair_idx];
         uint mismatch = 0;
 
         for (uint i = 0; i < pre_len; i++) {
-            uchar a = ADJUST_INPUT_CASE(addr_raw[i], case_sensitive);
-            uchar b = ADJUST_INPUT_CASE(alphabet_indices[prefixes[prefix_offset + i]], case_sensitive);
-            mismatch |= (a ^ b);
+            uchar a = ADJUST_INPUT_CASE(addr_raw[i], pair_case_sensitive);
+            mismatch |= (a ^ prefixes[prefix_offset + i]);
         }
 
         if (suf_len > 0) {
             for (uint i = 0; i < suf_len; i++) {
-                uchar a = ADJUST_INPUT_CASE(addr_raw[addr_len - suf_len + i], case_sensitive);
-                uchar b = ADJUST_INPUT_CASE(alphabet_indices[suffixes[suffix_offset + i]], case_sensitive);
-                mismatch |= (a ^ b);
+                uchar a = ADJUST_INPUT_CASE(addr_raw[addr_len - suf_len + i], pair_case_sensitive);
+                mismatch |= (a ^ suffixes[suffix_offset + i]);
             }
         }
 
-        prefix_offset += pre_len;
-        suffix_offset += suf_len;
-
         if (mismatch == 0) {
-            uint already_written = atomic_cmpxchg(out_index, 0, 1);
-            if (already_written == 0) {
-                uint slot = 0;
+            // one hit per pair per launch, so an easy pattern can't fill the buffer alone
+            if (atomic_cmpxchg(&pair_found[pair_idx], 0, 1) != 0) {
+                continue;
+            }
+
+            uint slot = atomic_inc(out_index);
+            if (slot >= out_capacity) {
+                // no room left: give the pair back so a later launch can report it
+                atomic_inc(out_overflow);
+                atomic_xchg(&pair_found[pair_idx], 0);
+                break;
+            }
 
-                out[slot] = addr_len;
+            __global uchar *record = out + slot * HIT_RECORD_SIZE;
 
-                for (uint j = 0; j < 32; j++) {
-                    out[slot + 1 + j] = key_base[j];
-                }
+            record[0] = addr_len;
 
-                for (uint j = 0; j < 32; j++) {
-                    out[slot + 33 + j] = public_key[j];
-                }
+            for (uint j = 0; j < 4; j++) {
+                record[4 + j] = (uchar) (pair_idx >> (j * 8));
+            }
+
+            for (uint j = 0; j < 32; j++) {
+                record[8 + j] = key_base[j];
+            }
+
+            for (uint j = 0; j < 32; j++) {
+                record[40 + j] = public_key[j];
             }
 
             break;
@@ -3820,4 +3945,80 @@ __kernel void generate_pubkey(
     }
 }
 
+__kernel void generate_pubkey(
+    __constant uchar *seed,
+    __global uchar *out,
+    const ulong launch_counter,
 
+    __global const uchar *prefixes,
+    __constant uchar *prefix_lengths,
+    __global const uchar *suffixes,
+    __constant uchar *suffix_lengths,
+    const uint pair_count,
+
+    __constant uchar *case_sensitive,
+
+    __global uint *out_index,
+    const uint out_capacity,
+    __global uint *out_overflow,
+    __global uint *pair_found,
+
+    __global const ulong *prefix_ranges,
+    __constant uchar *prefix_range_counts,
+    __constant uint *suffix_moduli,
+    __global const uint *suffix_residues,
+    __constant uchar *suffix_residue_counts,
+
+    const uint keys_per_item,
+    const uint iteration_bits,
+
+    // pattern table slots in use, the host flips them between launches
+    __constant uchar *active
+) {
+    uchar public_keys[INVERSION_BATCH][32] __attribute__((aligned(4)));
+    uchar key_bases[INVERSION_BATCH][32];
+    uchar seed_base[32];
+    ge_p3 points[INVERSION_BATCH];
+
+    // per-item setup, done once for all keys_per_item keys. Every launch covers
+    // 2^iteration_bits keys, launch_counter picks the block, so launches never overlap.
+    // Devices are kept apart by the device id the host folds into the seed.
+    const ulong item_id = get_global_id(0);
+    const ulong item_base = (launch_counter << iteration_bits) + item_id * keys_per_item;
+
+    for (uint i = 0; i < 32; i++) {
+        seed_base[i] = seed[i];
+    }
+
+    for (uint first = 0; first < keys_per_item; first += INVERSION_BATCH) {
+        // stop early once the hit buffer is full
+        if (*out_index >= out_capacity) {
+            return;
+        }
+
+        for (uint k = 0; k < INVERSION_BATCH; k++) {
+            const ulong key_index = item_base + first + k;
+
+            for (uint i = 0; i < 32; i++) {
+                key_bases[k][i] = seed_base[i];
+            }
+
+            // the host leaves the last 8 bytes of the seed zero for this counter
+            for (uint i = 0; i < 8; i++) {
+                key_bases[k][31 - i] ^= (uchar) (key_index >> (i * 8));
+            }
+
+            ed25519_derive_point(&points[k], key_bases[k]);
+        }
+
+        ge_p3_batch_tobytes(public_keys, points);
+
+        for (uint k = 0; k < INVERSION_BATCH; k++) {
+            match_and_record(public_keys[k], key_bases[k], out,
+                             prefixes, prefix_lengths, suffixes, suffix_lengths, pair_count,
+                             case_sensitive, out_index, out_capacity, out_overflow, pair_found,
+                             prefix_ranges, prefix_range_counts,
+                             suffix_moduli, suffix_residues, suffix_residue_counts, active);
+        }
+    }
+}
@@ -10,6 +10,17 @@ os.environ["PYOPENCL_COMPILER_OUTPUT"] = "1"
 os.environ["PYOPENCL_NO_CACHE"] = "TRUE"
 
 
+def get_all_devices(device_type: int = cl.device_type.ALL) -> List[cl.Device]:
+    devices = []
+    for platform_obj in cl.get_platforms():
+        try:
+            devices.extend(platform_obj.get_devices(device_type=device_type))
+        except cl.Error:
+            # platforms without a device of this type raise DEVICE_NOT_FOUND
+            continue
+    return devices
+
+
 def get_all_gpu_devices() -> List[cl.Device]:
     return [
         device
@@ -19,10 +30,10 @@ def get_all_gpu_devices() -> List[cl.Device]:
 
 
 def get_selected_gpu_devices(
-    platform_id: int, device_ids: List[int]
+    platform_id: int, device_ids: List[int], device_type: int = cl.device_type.GPU
 ) -> List[cl.Device]:
     platform_obj = cl.get_platforms()[platform_id]
-    devices = platform_obj.get_devices(device_type=cl.device_type.GPU)
+    devices = platform_obj.get_devices(device_type=device_type)
     return [devices[d_id] for d_id in device_ids]
 
 
@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import pyopencl as cl
+
+from config import DEVICE_PROFILES_PATH
+
+
+def device_profile_key(device: cl.Device) -> str:
+    return f"{device.platform.name}|{device.name}|{device.driver_version}"
+
+
+def load_device_profiles(path: str = DEVICE_PROFILES_PATH) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Can't read device profiles from {path}: {e}")
+        return {}
+
+
+def load_device_profile(device: cl.Device, path: str = DEVICE_PROFILES_PATH) -> Optional[dict]:
+    return load_device_profiles(path).get(device_profile_key(device))
+
+
+def save_device_profile(device: cl.Device, profile: dict, path: str = DEVICE_PROFILES_PATH) -> None:
+    profiles = load_device_profiles(path)
+    profiles[device_profile_key(device)] = profile
+
+    profile_path = Path(path)
+    profile_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=profile_path.parent, prefix=profile_path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(profiles, f, indent=2, sort_keys=True)
+        os.replace(tmp_name, profile_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
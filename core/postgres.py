@@ -1,6 +1,12 @@
+import os
+import select
+import socket
+import time
+from typing import Callable, Iterable
+
 import psycopg2
 
-import select
+from config import CLAIM_MAX_HELD, CLAIM_PAGE_SIZE, LEASE_SECONDS
 
 """
 
@@ -20,6 +26,22 @@ AFTER INSERT ON wallets_to_work
 FOR STATEMENT
 EXECUTE FUNCTION notify_batch_insert();
 
+## 3. Columns for difficulty estimates!
+
+ALTER TABLE wallets_to_work
+    ADD COLUMN IF NOT EXISTS expected_attempts double precision,
+    ADD COLUMN IF NOT EXISTS eta_seconds double precision,
+    ADD COLUMN IF NOT EXISTS message text;
+
+## 4. Columns and index for claiming rows!
+
+ALTER TABLE wallets_to_work
+    ADD COLUMN IF NOT EXISTS claimed_by text,
+    ADD COLUMN IF NOT EXISTS claimed_at timestamptz;
+
+CREATE INDEX IF NOT EXISTS wallets_to_work_claim_idx
+ON wallets_to_work (status, claimed_at);
+
 """
 
 
@@ -29,36 +51,105 @@ class Postgres:
         self.conn.autocommit = True
         self.cursor = self.conn.cursor()
 
-    def start_listen(self, callback):
+    def start_listen(
+        self,
+        callback: Callable[[list], None],
+        held_rows: Callable[[], Iterable] = list,
+        page_size: int = CLAIM_PAGE_SIZE,
+        max_held: int = CLAIM_MAX_HELD,
+        lease_seconds: float = LEASE_SECONDS,
+    ):
+        """
+        Claim new work on every NOTIFY and every few seconds, and pass each
+        claimed page to `callback`. At most `max_held` rows are held at once
+        (`held_rows` returns the ids this host is still working on), and their
+        leases are renewed so other hosts don't take them over.
+        """
         with self.conn.cursor() as cur:
             cur.execute("LISTEN new_data_channel;")
 
+        last_renew = time.time()
+        while True:
             while True:
-                if select.select([self.conn], [], [], 5) == ([], [], []):
-                    continue
-                self.conn.poll()
-                while self.conn.notifies:
-                    self.conn.notifies.pop(0)
-
-                    with self.conn.cursor() as select_cur:
-                        select_cur.execute("""
-                            SELECT id, token_address, start_address
-                            FROM public.wallets_to_work
-                            WHERE status = 'pending'
-                        """)
-                        rows = select_cur.fetchall()
-
+                limit = min(page_size, max_held - len(list(held_rows())))
+                if limit <= 0:
+                    break
+                rows = self.claim(limit, lease_seconds)
+                if rows:
                     callback(rows)
+                if len(rows) < limit:
+                    break
+
+            if time.time() - last_renew > lease_seconds / 3:
+                self.renew(list(held_rows()))
+                last_renew = time.time()
+
+            # пустой таймаут тоже повод проверить просроченные аренды
+            if select.select([self.conn], [], [], 5) == ([], [], []):
+                continue
+            self.conn.poll()
+            self.conn.notifies.clear()
+
+    @property
+    def owner(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def claim(self, limit: int, lease_seconds: float = LEASE_SECONDS) -> list:
+        """
+        Atomically move up to `limit` rows to in_progress and return them.
+        Pending rows and in_progress rows whose lease expired (their host
+        stopped renewing) are eligible; rows locked by another host are skipped.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE wallets_to_work
+                SET
+                    status = 'in_progress',
+                    claimed_by = %s,
+                    claimed_at = now()
+                WHERE id IN (
+                    SELECT id
+                    FROM wallets_to_work
+                    WHERE status = 'pending'
+                       OR (status = 'in_progress' AND claimed_at < now() - %s * interval '1 second')
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, token_address, start_address;
+                """,
+                (self.owner, lease_seconds, limit),
+            )
+            return cur.fetchall()
+
+    def renew(self, row_ids: list):
+        if not row_ids:
+            return
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE wallets_to_work
+                SET claimed_at = now()
+                WHERE id = ANY(%s) AND status = 'in_progress' AND claimed_by = %s;
+                """,
+                (row_ids, self.owner),
+            )
 
-    def update(self, start_address, private_address, status, row_id):
-        self.cursor.execute(f"""
+    def update_estimate(self, row_id, expected_attempts, eta_seconds, status=None, message=None):
+        """Write the difficulty estimate; `status` and `message` are only changed when given."""
+        self.cursor.execute(
+            """
             UPDATE wallets_to_work
-            SET 
-                start_address = '{start_address}',
-                private_address = '{private_address}',
-                status = '{status}'
-            WHERE id = '{row_id}';
-        """)
+            SET
+                expected_attempts = %s,
+                eta_seconds = %s,
+                status = COALESCE(%s, status),
+                message = COALESCE(%s, message)
+            WHERE id = %s;
+            """,
+            (expected_attempts, eta_seconds, status, message, row_id),
+        )
 
     def close(self):
         self.cursor.close()
@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+import pyopencl as cl
+from loguru import logger
+
+from config import PROFILE_DIR, PROFILE_MAX_EVENTS, PROFILE_WRITE_INTERVAL
+
+# trace tracks (Chrome trace "tid")
+HOST_TRACK = 1
+QUEUE_TRACK = 2
+DEVICE_TRACK = 3
+TRACK_NAMES = {HOST_TRACK: "host", QUEUE_TRACK: "queued on device", DEVICE_TRACK: "device"}
+
+
+class Tracer:
+    """
+    Records host phases and OpenCL events of one process as Chrome trace
+    events (chrome://tracing, ui.perfetto.dev). Device events need a queue
+    created with PROFILING_ENABLE; they are read once complete and placed on
+    the host clock using the offset measured at the first enqueue.
+    """
+
+    def __init__(self, name: str, max_events: int = PROFILE_MAX_EVENTS):
+        self.name = name
+        self.pid = os.getpid()
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.events: List[dict] = []
+        # (name, cl.Event, host µs at enqueue)
+        self.pending: List[Tuple[str, object, float]] = []
+        self.device_offset: Optional[float] = None
+        # phase -> [count, total µs]
+        self.totals: Dict[str, List[float]] = {}
+        self.last_write = time.time()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def add(self, name: str, track: int, start: float, duration: float, args: Optional[dict] = None):
+        count_total = self.totals.setdefault(f"{TRACK_NAMES[track]}: {name}", [0, 0.0])
+        count_total[0] += 1
+        count_total[1] += duration
+        if len(self.events) >= self.max_events:
+            return
+        event = {"name": name, "ph": "X", "pid": self.pid, "tid": track, "ts": start, "dur": duration}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    @contextmanager
+    def host(self, name: str):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add(name, HOST_TRACK, start, self.now() - start)
+
+    def device(self, name: str, event):
+        self.pending.append((name, event, self.now()))
+
+    def collect(self):
+        """Move completed OpenCL events into the trace."""
+        still_pending = []
+        for name, event, enqueued_at in self.pending:
+            if event.command_execution_status != cl.command_execution_status.COMPLETE:
+                still_pending.append((name, event, enqueued_at))
+                continue
+            queued, submit, start, end = (
+                event.profile.queued / 1e3,
+                event.profile.submit / 1e3,
+                event.profile.start / 1e3,
+                event.profile.end / 1e3,
+            )
+            if self.device_offset is None:
+                self.device_offset = enqueued_at - queued
+            offset = self.device_offset
+            self.add(name, QUEUE_TRACK, queued + offset, start - queued, {"submit_us": submit - queued})
+            self.add(name, DEVICE_TRACK, start + offset, end - start)
+        self.pending = still_pending
+
+    def write_every(self, directory: str = PROFILE_DIR, interval: float = PROFILE_WRITE_INTERVAL):
+        if time.time() - self.last_write >= interval:
+            self.write(directory)
+
+    def summary(self) -> str:
+        rows = sorted(self.totals.items(), key=lambda item: -item[1][1])
+        width = max([len(phase) for phase, _ in rows] + [5])
+        lines = [f"{'phase'.ljust(width)}  {'count':>8}  {'total ms':>10}  {'mean ms':>9}"]
+        for phase, (count, total) in rows:
+            lines.append(f"{phase.ljust(width)}  {count:>8}  {total / 1e3:>10.1f}  {total / count / 1e3:>9.3f}")
+        return "\n".join(lines)
+
+    def write(self, directory: str):
+        """Write <name>.trace.json and <name>.summary.txt, replacing earlier ones."""
+        self.collect()
+        self.last_write = time.time()
+        os.makedirs(directory, exist_ok=True)
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.name}}
+        ] + [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": track, "args": {"name": name}}
+            for track, name in TRACK_NAMES.items()
+        ]
+        trace_path = os.path.join(directory, f"{self.name}.trace.json")
+        with open(trace_path, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
+        with open(os.path.join(directory, f"{self.name}.summary.txt"), "w") as f:
+            f.write(self.summary() + "\n")
+        logger.info(f"Trace written to {trace_path}")
+
+
+def make_tracer(name: str) -> Optional[Tracer]:
+    """A tracer when PROFILE_DIR is set, otherwise None and profiling stays off."""
+    return Tracer(name) if PROFILE_DIR else None
+
+
+def trace(tracer: Optional[Tracer], name: str):
+    """`with trace(tracer, "phase"):` records the phase when profiling is on."""
+    return tracer.host(name) if tracer is not None else nullcontext()
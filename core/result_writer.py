@@ -0,0 +1,210 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import psycopg2
+from loguru import logger
+from psycopg2.extras import execute_batch
+
+from core.metrics import DB_WRITE_BUCKETS, Metrics
+from core.profiling import make_tracer, trace
+from config import (
+    PROFILE_DIR,
+    RESULT_BATCH_SIZE,
+    RESULT_FLUSH_INTERVAL,
+    RESULT_MAX_BACKOFF,
+    RESULT_SPILL_PATH,
+)
+
+# (row_id, start_address, private_address, status, message); errors have no address
+Result = Tuple[object, Optional[str], Optional[str], str, Optional[str]]
+
+UPDATE_RESULT_SQL = """
+    UPDATE wallets_to_work
+    SET
+        start_address = %s,
+        private_address = %s,
+        status = %s
+    WHERE id = %s;
+"""
+
+UPDATE_ERROR_SQL = """
+    UPDATE wallets_to_work
+    SET
+        status = %s,
+        message = %s
+    WHERE id = %s;
+"""
+
+
+class ResultWriter(threading.Thread):
+    """
+    Write-behind for found addresses. `put` only enqueues; a dedicated thread
+    flushes batches when `batch_size` results are waiting or `flush_interval`
+    seconds have passed. When the database is unavailable the batch is
+    appended to `spill_path` and replayed, with exponential backoff, once the
+    database is back, so no found key is lost while the server keeps running.
+    """
+
+    def __init__(
+        self,
+        db_config: dict,
+        metrics: Metrics,
+        spill_path: str = RESULT_SPILL_PATH,
+        batch_size: int = RESULT_BATCH_SIZE,
+        flush_interval: float = RESULT_FLUSH_INTERVAL,
+        max_backoff: float = RESULT_MAX_BACKOFF,
+    ):
+        super().__init__(daemon=True)
+        self.db_config = db_config
+        self.metrics = metrics
+        self.tracer = make_tracer("writer")
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+
+        self.results = queue.Queue()
+        # rows put but not written to the database yet, spilled ones included
+        self.pending_rows = set()
+        self.pending_lock = threading.Lock()
+        self.conn = None
+        self.backoff = 0.0
+        self.retry_at = 0.0
+
+    def put(self, row_id, address: str, private_key: str, status: str = "success"):
+        with self.pending_lock:
+            self.pending_rows.add(row_id)
+        self.results.put((row_id, address, private_key, status, None))
+
+    def put_error(self, row_id, message: str):
+        with self.pending_lock:
+            self.pending_rows.add(row_id)
+        self.results.put((row_id, None, None, "error", message))
+
+    def unflushed(self) -> List:
+        """Rows whose result is not in the database yet; their leases must still be renewed."""
+        with self.pending_lock:
+            return list(self.pending_rows)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Result] = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    result = self.results.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if result is None:
+                    stopping = True
+                    break
+                batch.append(result)
+
+            try:
+                if batch:
+                    with trace(self.tracer, "db flush"):
+                        self.flush(batch)
+                if time.time() >= self.retry_at and os.path.exists(self.spill_path):
+                    self.replay_spill()
+                if self.tracer is not None and batch:
+                    self.tracer.write_every()
+            except Exception as e:
+                # ни записать, ни сбросить в файл: держим в памяти и пробуем снова
+                logger.exception(e)
+                if batch and stopping:
+                    logger.error(f"Lost {len(batch)} result(s) on stop, rows {[result[0] for result in batch]}")
+                for result in batch if not stopping else []:
+                    self.results.put(result)
+                self.fail(e)
+
+        self.close()
+        if self.tracer is not None:
+            self.tracer.write(PROFILE_DIR)
+
+    def stop(self):
+        """Write everything put so far, then end the thread."""
+        self.results.put(None)
+        self.join()
+
+    def flush(self, batch: List[Result]):
+        if time.time() < self.retry_at:
+            # база недоступна, не ждём её в цикле записи
+            self.spill(batch)
+            return
+        try:
+            self.write(batch)
+            logger.info(f"Wrote {len(batch)} result(s)")
+        except psycopg2.Error as e:
+            self.fail(e)
+            self.spill(batch)
+
+    def write(self, batch: List[Result]):
+        write_start = time.time()
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(**self.db_config)
+        with self.conn.cursor() as cur:
+            execute_batch(
+                cur,
+                UPDATE_RESULT_SQL,
+                [
+                    (address, private_key, status, row_id)
+                    for row_id, address, private_key, status, _ in batch
+                    if address is not None
+                ],
+            )
+            execute_batch(
+                cur,
+                UPDATE_ERROR_SQL,
+                [
+                    (status, message, row_id)
+                    for row_id, address, _, status, message in batch
+                    if address is None
+                ],
+            )
+        self.conn.commit()
+        with self.pending_lock:
+            self.pending_rows.difference_update(result[0] for result in batch)
+        self.metrics.observe("solvanity_db_write_seconds", time.time() - write_start, DB_WRITE_BUCKETS)
+        self.backoff = 0.0
+        self.retry_at = 0.0
+
+    def fail(self, error: Exception):
+        self.backoff = min(self.max_backoff, self.backoff * 2 or 1.0)
+        self.retry_at = time.time() + self.backoff
+        logger.error(f"Result write failed, retry in {self.backoff:.0f}s: {error}")
+        self.close()
+
+    def spill(self, batch: List[Result]):
+        # в файле приватные ключи, доступ только владельцу
+        fd = os.open(self.spill_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        with os.fdopen(fd, "a") as f:
+            for result in batch:
+                f.write(json.dumps(result, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        logger.warning(f"Spilled {len(batch)} result(s) to {self.spill_path}")
+
+    def replay_spill(self):
+        with open(self.spill_path, "r") as f:
+            batch = [tuple(json.loads(line)) for line in f if line.strip()]
+        try:
+            if batch:
+                self.write(batch)
+        except psycopg2.Error as e:
+            self.fail(e)
+            return
+        os.remove(self.spill_path)
+        logger.info(f"Replayed {len(batch)} spilled result(s)")
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
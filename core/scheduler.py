@@ -0,0 +1,293 @@
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from core.estimator import expected_attempts
+from core.metrics import TIME_TO_RESULT_BUCKETS, Metrics, difficulty_label
+
+# message types on the shared scheduler queue, sent by workers
+MSG_IDLE = "idle"
+MSG_FOUND = "found"
+MSG_SPEED = "speed"
+MSG_ATTEMPTS = "attempts"
+MSG_METRICS = "metrics"
+# control message on a worker's task queue
+MSG_CANCEL = "cancel"
+
+# given-up tasks remembered for keys still on their way from the workers
+GIVEN_UP_KEEP = 1024
+
+
+class Task:
+    def __init__(self, row_id, prefix: str, suffix: str, case_sensitive: bool, idle: bool = False):
+        self.row_id = row_id
+        self.prefix = prefix
+        self.suffix = suffix
+        self.case_sensitive = case_sensitive
+        self.attempts = expected_attempts(prefix, suffix, case_sensitive)
+        # keys searched so far, summed over every worker running the task
+        self.searched = 0
+        self.queued_at = time.time()
+        self.started_at = None
+        # worker indexes currently searching this task
+        self.workers: Set[int] = set()
+        # filler work from `idle_tasks`, not a database row
+        self.idle = idle
+
+    def as_tuple(self) -> Tuple:
+        return self.row_id, self.prefix, self.suffix, self.case_sensitive
+
+
+class Scheduler:
+    """
+    Central pending pool for all workers. A worker reports idle whenever its
+    pattern table has free slots, also mid-search, and pulls a batch of the
+    easiest pending tasks, capped by `batch_size` tasks and `batch_attempts`
+    expected keys so hard patterns are spread one per device. The oldest
+    pending task rides along in every batch outside that cap, so a steady
+    stream of easy tasks can't starve a hard one. When nothing is
+    pending, an idle worker is given a copy of the hardest task that has been
+    running for at least `rebalance_after` seconds. Each worker searches with
+    its own seed and device id, so copies cover disjoint keys. The first worker to find it
+    wins, its result goes to `on_found`, and the others are told to cancel it.
+
+    Workers also report their measured keys/s, which starts at
+    `default_speeds` and is used for ETA estimates, and the keys they searched
+    per row. A task searched for `attempt_budget` times its expected attempts,
+    and at least `min_budget` keys, without a match is given up: `on_failed`
+    gets the reason and the workers are told to cancel it. A key for it that
+    was already on its way still goes to `on_found`.
+
+    A worker that has no row to search at all is given filler tasks from
+    `idle_tasks`, for instance stock harvesting; their keys go to
+    `on_idle_found` and they are never counted as rows or given up.
+    """
+
+    def __init__(
+        self,
+        task_queues: List[multiprocessing.Queue],
+        events: multiprocessing.Queue,
+        batch_size: int,
+        batch_attempts: float,
+        rebalance_after: float,
+        default_speeds: List[float],
+        on_found: Callable[[object, str, str], None],
+        on_failed: Callable[[object, str], None],
+        attempt_budget: float,
+        metrics: Metrics,
+        idle_tasks: Optional[Callable[[], List[Tuple]]] = None,
+        on_idle_found: Optional[Callable[[object, str, str], None]] = None,
+        min_budget: float = 0.0,
+    ):
+        self.task_queues = task_queues
+        self.events = events
+        self.batch_size = batch_size
+        self.batch_attempts = batch_attempts
+        self.rebalance_after = rebalance_after
+        self.on_found = on_found
+        self.on_failed = on_failed
+        self.attempt_budget = attempt_budget
+        self.min_budget = min_budget
+        self.metrics = metrics
+        self.idle_tasks = idle_tasks
+        self.on_idle_found = on_idle_found
+
+        self.lock = threading.Lock()
+        self.pending: List[Task] = []
+        self.running: Dict[object, Task] = {}
+        # row_id -> task given up by the budget, oldest first
+        self.given_up: Dict[object, Task] = {}
+        self.idle: Set[int] = set()
+        self.speeds: List[float] = list(default_speeds)
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def has(self, row_id) -> bool:
+        with self.lock:
+            return row_id in self.running or any(task.row_id == row_id for task in self.pending)
+
+    def row_ids(self) -> List:
+        """Rows this scheduler still holds, pending or running."""
+        with self.lock:
+            return [task.row_id for task in self.pending] + [
+                row_id for row_id, task in self.running.items() if not task.idle
+            ]
+
+    def keys_per_sec(self) -> float:
+        """Measured throughput of all workers together."""
+        return sum(self.speeds)
+
+    def add(self, tasks: List[Tuple]):
+        with self.lock:
+            known = {task.row_id for task in self.pending} | set(self.running)
+            for row_id, prefix, suffix, case_sensitive in tasks:
+                if row_id in known:
+                    continue
+                self.pending.append(Task(row_id, prefix, suffix, case_sensitive))
+            self.pending.sort(key=lambda task: task.attempts)
+            self.dispatch()
+
+    def cancel(self, row_ids: List):
+        """Drop tasks, pending or running, that are no longer wanted."""
+        row_ids = set(row_ids)
+        with self.lock:
+            self.pending = [task for task in self.pending if task.row_id not in row_ids]
+            for row_id in row_ids:
+                self.given_up.pop(row_id, None)
+                task = self.running.pop(row_id, None)
+                if task is None:
+                    continue
+                for worker in task.workers:
+                    self.task_queues[worker].put((MSG_CANCEL, [row_id]))
+            self.dispatch()
+
+    def stop(self):
+        """Cancel every task, filler tasks too, and hand out nothing more."""
+        with self.lock:
+            self.stopped = True
+            self.pending = []
+            for row_id, task in self.running.items():
+                for worker in task.workers:
+                    self.task_queues[worker].put((MSG_CANCEL, [row_id]))
+            self.running.clear()
+
+    def run(self):
+        while True:
+            try:
+                message = self.events.get(timeout=1)
+            except queue.Empty:
+                # running tasks age into rebalancing candidates
+                with self.lock:
+                    self.dispatch()
+                continue
+
+            with self.lock:
+                kind, worker = message[0], message[1]
+                if kind == MSG_IDLE:
+                    self.idle.add(worker)
+                elif kind == MSG_FOUND:
+                    self.finish(worker, *message[2:])
+                elif kind == MSG_SPEED:
+                    self.speeds[worker] = message[2]
+                elif kind == MSG_ATTEMPTS:
+                    self.account(message[2])
+                elif kind == MSG_METRICS:
+                    self.metrics.record_worker(worker, message[2])
+                self.dispatch()
+
+    def finish(self, worker: int, row_id, address: str, private_key: str):
+        task = self.running.pop(row_id, None)
+        if task is None:
+            task = self.given_up.pop(row_id, None)
+            if task is None:
+                # копия задачи на другом воркере уже нашла адрес
+                return
+            # бюджет кончился, пока ключ шёл от воркера: ключ всё равно записываем
+            logger.info(f"Task {row_id} found after it was given up")
+        for other in task.workers - {worker}:
+            self.task_queues[other].put((MSG_CANCEL, [row_id]))
+        if task.idle:
+            self.on_idle_found(row_id, address, private_key)
+            self.metrics.inc("solvanity_tasks_total", outcome="stocked")
+            return
+        self.on_found(row_id, address, private_key)
+        self.metrics.inc("solvanity_tasks_total", outcome="found")
+        self.metrics.observe(
+            "solvanity_time_to_result_seconds",
+            time.time() - task.started_at,
+            TIME_TO_RESULT_BUCKETS,
+            difficulty=difficulty_label(task.attempts),
+        )
+        logger.info(f"Task {row_id} found by worker {worker} in {time.time() - task.started_at:.1f}s")
+
+    def account(self, searched: Dict[object, int]):
+        for row_id, keys in searched.items():
+            task = self.running.get(row_id)
+            if task is None or task.idle:
+                # заполнение не ограничено бюджетом: снятая задача потеряла бы найденные ключи
+                continue
+            task.searched += keys
+            if task.searched > max(self.attempt_budget * task.attempts, self.min_budget):
+                self.running.pop(row_id)
+                self.given_up[row_id] = task
+                if len(self.given_up) > GIVEN_UP_KEEP:
+                    del self.given_up[next(iter(self.given_up))]
+                for worker in task.workers:
+                    self.task_queues[worker].put((MSG_CANCEL, [row_id]))
+                reason = (
+                    f"key not found after {task.searched:.3g} keys "
+                    f"({task.searched / task.attempts:.1f}x the expected {task.attempts:.3g})"
+                )
+                logger.warning(f"Task {row_id} given up: {reason}")
+                self.on_failed(row_id, reason)
+                self.metrics.inc("solvanity_tasks_total", outcome="budget_exhausted")
+
+    def dispatch(self):
+        if self.stopped:
+            return
+        for worker in sorted(self.idle):
+            batch = self.take_batch() or self.take_rebalance(worker) or self.take_idle(worker)
+            if not batch:
+                continue
+            now = time.time()
+            for task in batch:
+                task.workers.add(worker)
+                if task.started_at is None:
+                    task.started_at = now
+                self.running[task.row_id] = task
+            self.idle.discard(worker)
+            self.task_queues[worker].put([task.as_tuple() for task in batch])
+            logger.info(f"Worker {worker} <- {len(batch)} task(s), pending {len(self.pending)}")
+        self.metrics.set("solvanity_tasks_pending", len(self.pending))
+        self.metrics.set("solvanity_tasks_running", sum(not task.idle for task in self.running.values()))
+
+    def take_batch(self) -> List[Task]:
+        if not self.pending:
+            return []
+        # самая старая задача не ждёт за потоком лёгких и не входит в лимит попыток
+        oldest = min(self.pending, key=lambda task: task.queued_at)
+        self.pending.remove(oldest)
+        batch = [oldest]
+        attempts = 0.0
+        while self.pending and len(batch) < self.batch_size:
+            task = self.pending[0]
+            if attempts + task.attempts > self.batch_attempts:
+                break
+            batch.append(self.pending.pop(0))
+            attempts += task.attempts
+        return batch
+
+    def take_rebalance(self, worker: int) -> List[Task]:
+        now = time.time()
+        candidates = [
+            task
+            for task in self.running.values()
+            if not task.idle
+            and worker not in task.workers
+            and len(task.workers) < len(self.task_queues)
+            and now - task.started_at >= self.rebalance_after
+        ]
+        if not candidates:
+            return []
+        # the hardest task per helper gains the most from one more device
+        return [max(candidates, key=lambda task: task.attempts / len(task.workers))]
+
+    def take_idle(self, worker: int) -> List[Task]:
+        if self.idle_tasks is None:
+            return []
+        if any(worker in task.workers for task in self.running.values() if not task.idle):
+            # воркер занят строками, заполнение только для простаивающих
+            return []
+        batch = []
+        for row_id, prefix, suffix, case_sensitive in self.idle_tasks():
+            if row_id in self.running or len(batch) >= self.batch_size:
+                continue
+            batch.append(Task(row_id, prefix, suffix, case_sensitive, idle=True))
+        return batch
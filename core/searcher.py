@@ -1,15 +1,134 @@
 import time
+from collections import deque
+
 import numpy as np
 import pyopencl as cl
 
 from loguru import logger
-from typing import List, Optional, Tuple
+from typing import List, NamedTuple, Optional, Sequence, Tuple
 
 
+from core.opencl.cache import build_program
 from core.opencl.manager import (
-    get_all_gpu_devices,
+    get_all_devices,
     get_selected_gpu_devices,
 )
+from core.opencl.profiles import load_device_profile
+from core.profiling import Tracer, trace
+from core.utils.filters import (
+    MAX_PATTERN_LENGTH,
+    MAX_PREFIX_RANGES,
+    MAX_SUFFIX_RESIDUES,
+    compile_prefix_ranges,
+    compile_suffix_residues,
+    pattern_indices,
+)
+
+# must match HIT_RECORD_SIZE and the record layout in kernel.cl
+HIT_RECORD_DTYPE = np.dtype(
+    [
+        ("addr_len", np.uint8),
+        ("padding", np.uint8, 3),
+        ("pair_index", "<u4"),
+        ("seed", np.uint8, 32),
+        ("public_key", np.uint8, 32),
+    ]
+)
+HIT_RECORD_SIZE = HIT_RECORD_DTYPE.itemsize
+
+# kernel arguments of the pattern table arrays, in PatternTable.arrays order
+TABLE_ARGS = (3, 4, 5, 6, 8, 13, 14, 15, 16, 17, 20)
+
+
+class Hit(NamedTuple):
+    # pattern table slot the kernel reported
+    pair_index: int
+    address_length: int
+    # 64-byte Solana secret key: seed + public key
+    secret_key: bytes
+    # (row_id, prefix, suffix) that held the slot when the launch was queued
+    pair: Tuple
+
+
+def kernel_build_options(setting) -> List[str]:
+    return [f"-D INVERSION_BATCH={setting.inversion_batch}"]
+
+
+class LaunchSlot:
+    """Buffers owned by one in-flight launch: its hit records and counters."""
+
+    def __init__(self, context, out_capacity: int, pair_count: int):
+        self.output = np.zeros(out_capacity, dtype=HIT_RECORD_DTYPE)
+        self.output_index = np.zeros(1, dtype=np.uint32)
+        self.output_overflow = np.zeros(1, dtype=np.uint32)
+        self.zero_counter = np.zeros(1, dtype=np.uint32)
+        self.zero_pair_found = np.zeros(max(1, pair_count), dtype=np.uint32)
+        self.done_event = None
+        # pattern table as it was when this launch was queued, hits resolve against it
+        self.pairs: List[Optional[Tuple]] = []
+
+        self.memobj_output = cl.Buffer(
+            context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.output
+        )
+        self.memobj_out_index = cl.Buffer(
+            context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.output_index
+        )
+        self.memobj_out_overflow = cl.Buffer(
+            context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.output_overflow
+        )
+        self.memobj_pair_found = cl.Buffer(
+            context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.zero_pair_found
+        )
+
+
+class PatternTable:
+    """
+    Host copy of the device pattern table: one fixed-size row per slot in each
+    array, so a slot can be (re)written on its own. Arrays are kernel
+    arguments TABLE_ARGS, in this order.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.arrays = {
+            "prefixes": np.zeros((capacity, MAX_PATTERN_LENGTH), dtype=np.uint8),
+            "prefix_lengths": np.zeros(capacity, dtype=np.uint8),
+            "suffixes": np.zeros((capacity, MAX_PATTERN_LENGTH), dtype=np.uint8),
+            "suffix_lengths": np.zeros(capacity, dtype=np.uint8),
+            "case_sensitive": np.zeros(capacity, dtype=np.uint8),
+            "prefix_ranges": np.zeros((capacity, MAX_PREFIX_RANGES, 2), dtype=np.uint64),
+            "prefix_range_counts": np.zeros(capacity, dtype=np.uint8),
+            "suffix_moduli": np.zeros(capacity, dtype=np.uint32),
+            "suffix_residues": np.zeros((capacity, MAX_SUFFIX_RESIDUES), dtype=np.uint32),
+            "suffix_residue_counts": np.zeros(capacity, dtype=np.uint8),
+            "active": np.zeros(capacity, dtype=np.uint8),
+        }
+
+    def fill(self, slot: int, prefix: str, suffix: str, case_sensitive: bool):
+        if len(prefix) > MAX_PATTERN_LENGTH or len(suffix) > MAX_PATTERN_LENGTH:
+            raise ValueError(f"pattern longer than {MAX_PATTERN_LENGTH} characters: {prefix}__{suffix}")
+        for array in self.arrays.values():
+            array[slot] = 0
+
+        # folded once here, the kernel only folds the address side
+        prefix_b = pattern_indices(prefix, case_sensitive)
+        suffix_b = pattern_indices(suffix, case_sensitive)
+        self.arrays["prefixes"][slot, :len(prefix_b)] = np.frombuffer(prefix_b, dtype=np.uint8)
+        self.arrays["prefix_lengths"][slot] = len(prefix_b)
+        self.arrays["suffixes"][slot, :len(suffix_b)] = np.frombuffer(suffix_b, dtype=np.uint8)
+        self.arrays["suffix_lengths"][slot] = len(suffix_b)
+        self.arrays["case_sensitive"][slot] = case_sensitive
+
+        ranges = compile_prefix_ranges(prefix, case_sensitive)
+        if ranges:
+            self.arrays["prefix_ranges"][slot, :len(ranges)] = np.array(ranges, dtype=np.uint64)
+        self.arrays["prefix_range_counts"][slot] = len(ranges)
+
+        modulus, residues = compile_suffix_residues(suffix, case_sensitive)
+        self.arrays["suffix_moduli"][slot] = modulus
+        self.arrays["suffix_residues"][slot, :len(residues)] = residues
+        self.arrays["suffix_residue_counts"][slot] = len(residues)
+        self.arrays["active"][slot] = 1
 
 
 class Searcher:
@@ -19,172 +138,276 @@ class Searcher:
         index: int,
         setting,
         chosen_devices: Optional[Tuple[int, List[int]]] = None,
+        device_type: int = cl.device_type.GPU,
+        tracer: Optional[Tracer] = None,
     ):
         if chosen_devices is None:
-            devices = get_all_gpu_devices()
+            devices = get_all_devices(device_type)
         else:
-            devices = get_selected_gpu_devices(*chosen_devices)
+            devices = get_selected_gpu_devices(*chosen_devices, device_type=device_type)
 
         enabled_device = devices[index]
+        if setting.use_profile:
+            profile = load_device_profile(enabled_device)
+            if profile:
+                setting.apply_profile(profile)
+                logger.info(f"Loaded tuned profile for {enabled_device.name}: {profile}")
+
+        self.device = enabled_device
         self.context = cl.Context([enabled_device])
-        self.gpu_chunks = len(devices)
-        self.command_queue = cl.CommandQueue(self.context)
+        # with a tracer every enqueue is timed on the device as well
+        self.tracer = tracer
+        self.command_queue = cl.CommandQueue(
+            self.context,
+            properties=cl.command_queue_properties.PROFILING_ENABLE if tracer is not None else 0,
+        )
         self.setting = setting
         self.index = index
         self.display_index = (
             index if chosen_devices is None else chosen_devices[1][index]
         )
-        self.start_index = 0
-        self.prefix_suffix_pairs = []
         self.prev_time = None
+        self.keys_per_sec = 0.0
+        # False when the last find() didn't measure the device, keys_per_sec is from before
+        self.speed_measured = False
+        self.last_done_time = None
+        # host-side seconds spent in each step of the last find / pattern update
+        self.stage_times = {}
         self.is_nvidia = "NVIDIA" in enabled_device.platform.name.upper()
 
-        program = cl.Program(self.context, kernel_source).build()
+        self.inversion_batch = setting.inversion_batch
+        program = build_program(
+            self.context, enabled_device, kernel_source, kernel_build_options(setting)
+        )
         self.kernel = cl.Kernel(program, "generate_pubkey")
 
-        self.group_offset = None
-        self.memobj_key32 = None
-        self.memobj_output = None
-        self.memobj_out_index = None
-        self.memobj_occupied_bytes = None
-        self.memobj_group_offset = None
-        self.prefixes_buf = None
-        self.prefix_lengths_buf = None
-        self.suffix_buf = None
-
-        self.suffixes_buf = None
-        self.suffix_lengths_buf = None
-
-        self.output = None
-        self.output_index = None
-
-    def set_search_params_batch(self, prefix_suffix_pairs: List[Tuple[str, str, str]], case_sensitive: bool):
-        prefix_bytes_list = []
-        suffix_bytes_list = []
-        prefix_lengths = []
-        suffix_lengths = []
-
-        for _, prefix, suffix in prefix_suffix_pairs:
-            prefix_b = prefix.encode('utf-8') if prefix else b''
-            suffix_b = suffix.encode('utf-8') if suffix else b''
-
-            prefix_bytes_list.append(prefix_b)
-            suffix_bytes_list.append(suffix_b)
-
-            prefix_lengths.append(len(prefix_b))
-            suffix_lengths.append(len(suffix_b))
-
-        self.prefix_suffix_pairs = prefix_suffix_pairs
-
-        flat_prefixes = b''.join(prefix_bytes_list)
-        flat_suffixes = b''.join(suffix_bytes_list)
-
-        prefix_buf = np.frombuffer(flat_prefixes, dtype=np.uint8) if flat_prefixes else np.zeros(1, dtype=np.uint8)
-
-        if flat_suffixes:
-            suffix_buf = np.frombuffer(flat_suffixes, dtype=np.uint8)
-        else:
-            suffix_buf = np.zeros(1, dtype=np.uint8)
-
-        prefix_lengths = np.array(prefix_lengths, dtype=np.uint8)
-        suffix_lengths = np.array(suffix_lengths, dtype=np.uint8)
-        case_sensitive = np.uint8(case_sensitive)
-        pair_count = np.uint32(len(prefix_suffix_pairs))
-
-        self.output = np.empty(65, dtype=np.uint8)
-        self.output_index = np.zeros(1, dtype=np.uint32)
-
-        occupied_bytes = np.array([self.setting.iteration_bytes], dtype=np.uint32)
-        self.setting.key32 = self.setting.generate_key32()  # уникальный seed для уникального приватника
-        self.group_offset = np.array([self.index], dtype=np.uint32)
-
+        # preallocated pattern table, patterns come and go by writing single slots
+        self.table = PatternTable(setting.pattern_capacity)
+        self.patterns: List[Optional[Tuple]] = [None] * setting.pattern_capacity
+        self.pattern_slots = {}
+        self.table_buffers = {
+            name: cl.Buffer(self.context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=array)
+            for name, array in self.table.arrays.items()
+        }
+        # host copies of queued slot writes, kept alive until the write completes
+        self.pending_writes = []
+
+        # уникальный seed для уникального приватника, на устройство грузится один раз
+        self.setting.key32 = self.setting.generate_key32(self.index)
         self.memobj_key32 = cl.Buffer(
-            self.context,
-            cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.setting.key32
-        )
-
-        self.memobj_output = cl.Buffer(
-            self.context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.output
-        )
-
-        self.memobj_occupied_bytes = cl.Buffer(
-            self.context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR,
-            hostbuf=occupied_bytes
-        )
-
-        self.memobj_group_offset = cl.Buffer(
-            self.context,
-            cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR,
-            hostbuf=self.group_offset,
-            size=self.group_offset.nbytes
-        )
-
-        self.memobj_out_index = cl.Buffer(
-            self.context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.output_index
+            self.context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.setting.key32
         )
-        self.prefixes_buf = cl.Buffer(
-            self.context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=prefix_buf
-        )
-        self.prefix_lengths_buf = cl.Buffer(
-            self.context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=prefix_lengths
-        )
-        self.suffixes_buf = cl.Buffer(
-            self.context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=suffix_buf
-        )
-        self.suffix_lengths_buf = cl.Buffer(
-            self.context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=suffix_lengths
-        )
-
+        self.launch_counter = 0
+
+        # one record per pattern is enough, each pattern is reported at most once per launch
+        self.out_capacity = max(1, min(self.setting.hit_capacity, setting.pattern_capacity))
+        self.pipeline_depth = setting.pipeline_depth
+        self.slots = [
+            LaunchSlot(self.context, self.out_capacity, setting.pattern_capacity)
+            for _ in range(self.pipeline_depth)
+        ]
+        # launches queued on the device, oldest first
+        self.in_flight = deque()
+        # pairs the launch returned by the last find() searched for
+        self.launch_pairs: List[Tuple] = []
+
+        # arguments 1, 2, 7, 9, 11 and 12 belong to a launch, see enqueue_launch
         self.kernel.set_arg(0, self.memobj_key32)
-        self.kernel.set_arg(1, self.memobj_output)
-        self.kernel.set_arg(2, self.memobj_occupied_bytes)
-        self.kernel.set_arg(3, self.memobj_group_offset)
-        self.kernel.set_arg(4, self.prefixes_buf)
-        self.kernel.set_arg(5, self.prefix_lengths_buf)
-        self.kernel.set_arg(6, self.suffixes_buf)
-        self.kernel.set_arg(7, self.suffix_lengths_buf)
-        self.kernel.set_arg(8, pair_count)
-        self.kernel.set_arg(9, case_sensitive)
-        self.kernel.set_arg(10, self.memobj_out_index)
-
-    def find(self, log_stats: bool = True):
-        start_time = time.time()
-
-        self.output_index[0] = 0
-        cl.enqueue_copy(self.command_queue, self.memobj_out_index, self.output_index)
-        self.command_queue.finish()
-
-        offset = np.array([self.index], dtype=np.uint32)
+        for arg_index, name in zip(TABLE_ARGS, self.table.arrays):
+            self.kernel.set_arg(arg_index, self.table_buffers[name])
+        self.kernel.set_arg(10, np.uint32(self.out_capacity))
+        self.kernel.set_arg(18, np.uint32(self.setting.keys_per_item))
+        self.kernel.set_arg(19, np.uint32(self.setting.iteration_bits))
+
+    @property
+    def prefix_suffix_pairs(self) -> List[Tuple]:
+        return [pair for pair in self.patterns if pair is not None]
+
+    @property
+    def free_slots(self) -> int:
+        return self.table.capacity - len(self.pattern_slots)
+
+    @property
+    def pair_count(self) -> int:
+        # the kernel scans slots up to the highest one in use
+        return max(self.pattern_slots.values(), default=-1) + 1
+
+    def traced(self, name: str, event):
+        if self.tracer is not None:
+            self.tracer.device(name, event)
+        return event
+
+    def drain(self):
+        """Wait for queued launches and drop their results."""
+        with trace(self.tracer, "finish"):
+            self.command_queue.finish()
+        self.in_flight.clear()
+        self.pending_writes.clear()
+        self.last_done_time = None
+
+    def write_slot(self, slot: int, names):
+        for name in names:
+            row = np.ascontiguousarray(self.table.arrays[name][slot])
+            event = self.traced(f"write {name}", cl.enqueue_copy(
+                self.command_queue,
+                self.table_buffers[name],
+                row,
+                device_offset=slot * row.nbytes,
+                is_blocking=False,
+            ))
+            self.pending_writes.append((event, row))
+
+    def add_patterns(self, prefix_suffix_pairs: List[Tuple[str, str, str]], case_sensitive: Sequence[bool]):
+        """
+        Put (row_id, prefix, suffix) pairs into free table slots, `case_sensitive`
+        holds one flag per pair. They take part from the next queued launch on.
+        """
+        params_start = time.time()
+        for pair, pair_case_sensitive in zip(prefix_suffix_pairs, case_sensitive):
+            if pair in self.pattern_slots:
+                continue
+            if not self.free_slots:
+                raise ValueError(f"pattern table is full ({self.table.capacity} slots)")
+            slot = self.patterns.index(None)
+            _, prefix, suffix = pair
+            self.table.fill(slot, prefix, suffix, pair_case_sensitive)
+            # the in-order queue runs these before any later launch
+            self.write_slot(slot, self.table.arrays)
+            self.patterns[slot] = pair
+            self.pattern_slots[pair] = slot
+        self.stage_times["params"] = time.time() - params_start
+
+    def remove_patterns(self, prefix_suffix_pairs: List[Tuple[str, str, str]]):
+        """Retire pairs by clearing their active flag; launches already queued still search them."""
+        for pair in prefix_suffix_pairs:
+            slot = self.pattern_slots.pop(pair, None)
+            if slot is None:
+                continue
+            self.table.arrays["active"][slot] = 0
+            self.write_slot(slot, ["active"])
+            self.patterns[slot] = None
+
+    def set_search_params_batch(
+        self, prefix_suffix_pairs: List[Tuple[str, str, str]], case_sensitive: Sequence[bool]
+    ):
+        """Start a fresh search over exactly these pairs, with a new seed."""
+        self.drain()
+        self.remove_patterns(list(self.pattern_slots))
+        self.add_patterns(prefix_suffix_pairs, case_sensitive)
 
-        cl.enqueue_copy(self.command_queue, self.memobj_group_offset, offset)
+        self.setting.key32 = self.setting.generate_key32(self.index)
         cl.enqueue_copy(self.command_queue, self.memobj_key32, self.setting.key32)
-        self.command_queue.finish()
-
-        global_worker_size = self.setting.global_work_size // self.gpu_chunks
-        evt = cl.enqueue_nd_range_kernel(
+        self.launch_counter = 0
+
+    def enqueue_launch(self, slot: LaunchSlot):
+        """Queue counter resets, kernel and readbacks without blocking."""
+        self.traced("reset out_index", cl.enqueue_copy(
+            self.command_queue, slot.memobj_out_index, slot.zero_counter, is_blocking=False
+        ))
+        self.traced("reset out_overflow", cl.enqueue_copy(
+            self.command_queue, slot.memobj_out_overflow, slot.zero_counter, is_blocking=False
+        ))
+        self.traced("reset pair_found", cl.enqueue_copy(
+            self.command_queue, slot.memobj_pair_found, slot.zero_pair_found, is_blocking=False
+        ))
+
+        # kernel arguments are captured at enqueue time, so slots can share the kernel
+        self.kernel.set_arg(1, slot.memobj_output)
+        self.kernel.set_arg(2, np.uint64(self.launch_counter))
+        self.kernel.set_arg(7, np.uint32(self.pair_count))
+        self.kernel.set_arg(9, slot.memobj_out_index)
+        self.kernel.set_arg(11, slot.memobj_out_overflow)
+        self.kernel.set_arg(12, slot.memobj_pair_found)
+        slot.pairs = list(self.patterns)
+
+        self.traced("generate_pubkey", cl.enqueue_nd_range_kernel(
             self.command_queue,
             self.kernel,
-            (global_worker_size,),
+            (self.global_worker_size,),
             (self.setting.local_work_size,),
-        )
-        evt.wait()
-
-        cl.enqueue_copy(self.command_queue, self.output, self.memobj_output).wait()
-        cl.enqueue_copy(self.command_queue, self.output_index, self.memobj_out_index).wait()
-
-        self.prev_time = time.time() - start_time
+        ))
+        self.launch_counter += 1
+
+        self.traced("read output", cl.enqueue_copy(
+            self.command_queue, slot.output, slot.memobj_output, is_blocking=False
+        ))
+        self.traced("read out_overflow", cl.enqueue_copy(
+            self.command_queue, slot.output_overflow, slot.memobj_out_overflow, is_blocking=False
+        ))
+        slot.done_event = self.traced("read out_index", cl.enqueue_copy(
+            self.command_queue, slot.output_index, slot.memobj_out_index, is_blocking=False
+        ))
+        self.command_queue.flush()
+        self.in_flight.append(slot)
+
+    @property
+    def global_worker_size(self) -> int:
+        # every work item loops over keys_per_item keys; the launch size is per
+        # device and doesn't shrink as devices are added
+        return self.setting.global_work_size // self.setting.keys_per_item
 
-        if log_stats:
+    def find(self, log_stats: bool = True):
+        """
+        Return the hits of the oldest queued launch. The pipeline is kept
+        pipeline_depth launches deep, and the freed slot is queued again before
+        returning, so the device keeps working while the caller handles hits.
+        """
+        refilled = not self.in_flight
+        if refilled:
+            for slot in self.slots:
+                self.enqueue_launch(slot)
+            self.last_done_time = time.time()
+
+        wait_start = time.time()
+        slot = self.in_flight.popleft()
+        with trace(self.tracer, "wait launch"):
+            slot.done_event.wait()
+        collect_start = time.time()
+
+        keys_per_launch = self.global_worker_size * self.setting.keys_per_item
+        hit_count = min(int(slot.output_index[0]), self.out_capacity)
+        overflow = int(slot.output_overflow[0])
+
+        results = [
+            Hit(
+                pair_index=int(record["pair_index"]),
+                address_length=int(record["addr_len"]),
+                secret_key=record["seed"].tobytes() + record["public_key"].tobytes(),
+                pair=slot.pairs[int(record["pair_index"])],
+            )
+            for record in slot.output[:hit_count]
+        ]
+        self.launch_pairs = [pair for pair in slot.pairs if pair is not None]
+        # every launch queued before this one has finished, and so have the writes before it
+        self.pending_writes = [
+            (event, row)
+            for event, row in self.pending_writes
+            if event.command_execution_status != cl.command_execution_status.COMPLETE
+        ]
+
+        enqueue_start = time.time()
+        with trace(self.tracer, "enqueue launch"):
+            self.enqueue_launch(slot)
+
+        done_time = time.time()
+        self.stage_times["wait"] = collect_start - wait_start
+        self.stage_times["collect"] = enqueue_start - collect_start
+        self.stage_times["enqueue"] = done_time - enqueue_start
+        self.prev_time = done_time - self.last_done_time
+        self.last_done_time = done_time
+        # the first launch after a refill also pays for the pipeline fill, keep the last measurement
+        self.speed_measured = not refilled
+        if self.speed_measured:
+            self.keys_per_sec = keys_per_launch / max(self.prev_time, 1e-9)
+
+        if log_stats and self.speed_measured:
             logger.info(
-                f"GPU {self.display_index} Speed: {global_worker_size / ((time.time() - start_time) * 1e6):.2f} MH/s"
+                f"GPU {self.display_index} Speed: {self.keys_per_sec / 1e6:.2f} MH/s"
             )
 
-        results = []
-        if self.output_index[0] == 1:
-            length = self.output[0]
-            seed = self.output[1: 65].copy()
-            results.append((length, seed))
-
-        self.setting.increase_key32()
+        if overflow:
+            logger.warning(
+                f"GPU {self.display_index} dropped {overflow} hits, hit buffer is full"
+            )
 
         return results
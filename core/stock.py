@@ -0,0 +1,208 @@
+import mmap
+import os
+import struct
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from base58 import b58decode, b58encode
+from loguru import logger
+from nacl.secret import SecretBox
+from nacl.utils import random as random_bytes
+
+from core.cpu_searcher import derive_keypair
+from core.metrics import Metrics
+from core.utils.filters import address_matches, pattern_error
+
+# kind, served record index, pattern length, "prefix__suffix", nonce, encrypted seed
+# a pattern is at most MAX_PATTERN_LENGTH characters plus the separator
+RECORD = struct.Struct(">cQB46s24s48s")
+RECORD_KEY = b"K"
+RECORD_SERVED = b"S"
+
+# row ids of harvest tasks, never written to the database
+STOCK_ROW = "stock"
+
+Pattern = Tuple[str, str]
+
+
+def stock_row_id(prefix: str, suffix: str, copy: int) -> Tuple[str, str, str, int]:
+    # several copies of a pattern are harvested at once, each a separate table slot
+    return STOCK_ROW, prefix, suffix, copy
+
+
+def pattern_name(prefix: str, suffix: str) -> str:
+    return f"{prefix}__{suffix}"
+
+
+def parse_stock_patterns(spec: str, low: int, target: int) -> Dict[Pattern, Tuple[int, int]]:
+    """
+    Parse "So__:10:50,x__pump" into {(prefix, suffix): (low, target)}; the
+    marks are optional and default to `low` and `target`. Patterns no
+    address can match are logged and skipped.
+    """
+    patterns = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, *marks = item.split(":")
+        prefix, _, suffix = name.partition("__")
+        error = pattern_error(prefix, suffix, True)
+        if error:
+            logger.error(f"Skip stock pattern {item}: {error}")
+            continue
+        pattern_low = int(marks[0]) if marks else low
+        pattern_target = int(marks[1]) if len(marks) > 1 else max(target, pattern_low + 1)
+        patterns[(prefix, suffix)] = (pattern_low, pattern_target)
+    return patterns
+
+
+class StockStore:
+    """
+    Pre-generated keys for short, frequent patterns. Keys live in an
+    append-only file of fixed-size records: a harvested seed, encrypted with
+    `key` (NaCl SecretBox), or a tombstone naming a record that was served.
+    The file is read through mmap and the index (pattern -> unserved records)
+    is rebuilt from it on start; every append is fsynced before it counts,
+    so a served key is never handed out twice, even across restarts.
+
+    Each pattern has a low-water mark and a target: once its stock drops to
+    `low` it is refilled up to `target`, and `wanted` lists the patterns being
+    refilled so idle workers can harvest them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        key: bytes,
+        patterns: Dict[Pattern, Tuple[int, int]],
+        metrics: Optional[Metrics] = None,
+    ):
+        self.path = path
+        self.box = SecretBox(key)
+        self.patterns = patterns
+        self.metrics = metrics
+
+        self.lock = threading.Lock()
+        self.available: Dict[Pattern, Deque[int]] = {pattern: deque() for pattern in patterns}
+        self.refilling = set()
+        self.records = 0
+        self.view = None
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self.file = os.fdopen(fd, "r+b", buffering=0)
+        size = os.fstat(fd).st_size
+        if size % RECORD.size:
+            # запись оборвалась на полуслове (падение при append), хвост отбрасываем
+            logger.warning(f"Stock {path}: dropping {size % RECORD.size} bytes of a torn record")
+            os.truncate(fd, size - size % RECORD.size)
+        self.load()
+
+        for pattern in patterns:
+            self.update_marks(pattern)
+        logger.info(
+            f"Stock {path}: "
+            + ", ".join(f"{pattern_name(*p)} {len(self.available[p])}" for p in patterns)
+        )
+
+    def remap(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if size and (self.view is None or len(self.view) < size):
+            if self.view is not None:
+                self.view.close()
+            self.view = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        return size // RECORD.size
+
+    def record(self, index: int) -> tuple:
+        return RECORD.unpack_from(self.view, index * RECORD.size)
+
+    def load(self):
+        self.records = self.remap()
+        served = set()
+        keys = []
+        for index in range(self.records):
+            kind, ref, length, name, _, _ = self.record(index)
+            if kind == RECORD_SERVED:
+                served.add(ref)
+            elif kind == RECORD_KEY:
+                prefix, _, suffix = name[:length].decode().partition("__")
+                keys.append((index, (prefix, suffix)))
+        for index, pattern in keys:
+            # ключи шаблонов, убранных из STOCK_PATTERNS, остаются в файле, но не выдаются
+            if index not in served and pattern in self.available:
+                self.available[pattern].append(index)
+
+    def append(self, record: bytes) -> int:
+        self.file.write(record)
+        os.fsync(self.file.fileno())
+        index = self.records
+        self.records += 1
+        return index
+
+    def count(self, prefix: str, suffix: str) -> int:
+        with self.lock:
+            return len(self.available.get((prefix, suffix), ()))
+
+    def wanted(self) -> List[Tuple[Pattern, int]]:
+        """(pattern, keys missing to target) for patterns that dropped to their low-water mark and are being refilled."""
+        with self.lock:
+            return [
+                (pattern, self.patterns[pattern][1] - len(self.available[pattern]))
+                for pattern in sorted(self.refilling)
+            ]
+
+    def update_marks(self, pattern: Pattern):
+        low, target = self.patterns[pattern]
+        count = len(self.available[pattern])
+        if count <= low:
+            self.refilling.add(pattern)
+        elif count >= target:
+            self.refilling.discard(pattern)
+        if self.metrics is not None:
+            self.metrics.set("solvanity_stock_keys", count, pattern=pattern_name(*pattern))
+
+    def put(self, row_id, address: str, private_key: str):
+        """Store a key found by a harvest task; same signature as ResultWriter.put."""
+        _, prefix, suffix, _ = row_id
+        pattern = (prefix, suffix)
+        name = pattern_name(prefix, suffix).encode()
+        if pattern not in self.patterns:
+            logger.warning(f"Not a stock pattern: {pattern_name(prefix, suffix)}")
+            return
+
+        nonce = random_bytes(SecretBox.NONCE_SIZE)
+        seed = b58decode(private_key)[:32]
+        ciphertext = self.box.encrypt(seed, nonce).ciphertext
+        with self.lock:
+            index = self.append(RECORD.pack(RECORD_KEY, 0, len(name), name, nonce, ciphertext))
+            self.available[pattern].append(index)
+            self.update_marks(pattern)
+        logger.info(f"Stocked {address} for {pattern_name(prefix, suffix)}")
+
+    def take(self, prefix: str, suffix: str) -> Optional[Tuple[str, str]]:
+        """Hand out one stocked key for the pattern as (address, private key), None when out of stock."""
+        pattern = (prefix, suffix)
+        with self.lock:
+            while self.available.get(pattern):
+                index = self.available[pattern].popleft()
+                # отметка о выдаче пишется до ответа: после падения ключ не выдадут второй раз
+                self.append(RECORD.pack(RECORD_SERVED, index, 0, b"", b"", b""))
+                self.update_marks(pattern)
+
+                self.remap()
+                _, _, _, _, nonce, ciphertext = self.record(index)
+                try:
+                    secret_key = derive_keypair(self.box.decrypt(ciphertext, nonce))
+                except Exception as e:
+                    logger.error(f"Stock record {index} can't be decrypted: {e}")
+                    continue
+                address = b58encode(secret_key[32:]).decode()
+                if not address_matches(address, prefix, suffix, True):
+                    logger.error(f"Stock record {index} doesn't match {pattern_name(prefix, suffix)}")
+                    continue
+                return address, b58encode(secret_key).decode()
+        return None
+
+    def close(self):
+        with self.lock:
+            if self.view is not None:
+                self.view.close()
+            self.file.close()
@@ -0,0 +1,99 @@
+import time
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from core.config import HostSetting
+from core.searcher import Searcher
+
+# valid and reachable, but 58^11 keys away: exercises the real filter path and never hits
+TUNE_PAIRS = [(0, "SoLVanityCL", "")]
+
+# launches longer than this make new patterns wait too long
+TUNE_MAX_LAUNCH_LATENCY = 0.5
+
+TUNE_SPACE = {
+    "inversion_batch": [1, 2, 4, 8],
+    "keys_per_item": [1, 2, 4, 8, 16, 32, 64],
+    "local_work_size": [32, 64, 128, 256],
+    "iteration_bits": [20, 22, 24, 26, 28],
+}
+
+
+def measure(
+    kernel_source: str,
+    index: int,
+    profile: dict,
+    duration: float,
+    chosen_devices: Optional[Tuple[int, List[int]]] = None,
+) -> Optional[dict]:
+    """Run generate_pubkey with `profile` for about `duration` seconds, return MH/s and latency."""
+    if profile["keys_per_item"] < profile["inversion_batch"]:
+        return None
+    setting = HostSetting(kernel_source, profile["iteration_bits"], use_profile=False)
+    setting.apply_profile(profile)
+
+    searcher = Searcher(kernel_source, index, setting, chosen_devices)
+    if searcher.global_worker_size < setting.local_work_size:
+        return None
+    searcher.set_search_params_batch(TUNE_PAIRS, [True] * len(TUNE_PAIRS))
+
+    # the first launches include program load and queue ramp-up
+    for _ in range(setting.pipeline_depth):
+        searcher.find(False)
+
+    launches = 0
+    latencies = []
+    st = time.time()
+    while time.time() - st < duration or launches < 2:
+        searcher.find(False)
+        latencies.append(searcher.prev_time)
+        launches += 1
+    elapsed = time.time() - st
+    searcher.drain()
+
+    keys = launches * searcher.global_worker_size * setting.keys_per_item
+    return {
+        "mhs": keys / elapsed / 1e6,
+        "launch_latency": sorted(latencies)[len(latencies) // 2],
+    }
+
+
+def tune_device(
+    kernel_source: str,
+    index: int,
+    base_profile: dict,
+    duration: float = 3.0,
+    chosen_devices: Optional[Tuple[int, List[int]]] = None,
+) -> dict:
+    """
+    Greedy per-parameter sweep: each parameter in TUNE_SPACE is swept in turn with
+    the others fixed at their best value so far. Profiles whose launches take
+    longer than TUNE_MAX_LAUNCH_LATENCY are skipped.
+    """
+    best = dict(base_profile)
+    best_stats = None
+
+    for name, values in TUNE_SPACE.items():
+        for value in values:
+            candidate = dict(best, **{name: value})
+            if candidate == best and best_stats is not None:
+                continue
+            try:
+                stats = measure(kernel_source, index, candidate, duration, chosen_devices)
+            except Exception as e:
+                logger.warning(f"Skip {candidate}: {e}")
+                continue
+            if stats is None:
+                continue
+
+            logger.info(
+                f"GPU {index} {name}={value}: {stats['mhs']:.2f} MH/s, "
+                f"latency {stats['launch_latency'] * 1000:.1f} ms"
+            )
+            if stats["launch_latency"] > TUNE_MAX_LAUNCH_LATENCY:
+                continue
+            if best_stats is None or stats["mhs"] > best_stats["mhs"]:
+                best, best_stats = candidate, stats
+
+    return dict(best, **(best_stats or {}))
@@ -0,0 +1,186 @@
+from itertools import product
+from typing import List, Optional, Tuple
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# a 32-byte key without leading zero bytes always encodes to 43 or 44 characters
+ADDRESS_LENGTHS = (43, 44)
+# pattern table row width, must match MAX_PATTERN_LENGTH in kernel.cl
+MAX_PATTERN_LENGTH = 44
+
+# must match MAX_PREFIX_RANGES in kernel.cl
+MAX_PREFIX_RANGES = 16
+
+# the kernel reduces every key modulo 58**5 once, longer suffixes are checked on
+# their last five characters and confirmed after encoding
+SUFFIX_RESIDUE_CHARS = 5
+# must match MAX_SUFFIX_RESIDUES in kernel.cl, 2**SUFFIX_RESIDUE_CHARS case variants
+MAX_SUFFIX_RESIDUES = 32
+
+KEY_BITS = 256
+# the kernel compares only the top 64 bits of the public key
+RANGE_SHIFT = KEY_BITS - 64
+
+# prefix_reachable checks exactly up to this many case variants
+MAX_REACHABLE_VARIANTS = 4096
+
+
+def fold_case(character: str) -> str:
+    """Same folding as ADJUST_INPUT_CASE in kernel.cl: lower case maps to upper
+    case when the upper case letter exists in the alphabet. Pattern letters
+    outside the alphabet ('I', 'O') map to the case that exists, since
+    addresses only ever hold that one."""
+    upper = character.upper()
+    if upper != character and upper in BASE58_ALPHABET:
+        return upper
+    lower = character.lower()
+    if character not in BASE58_ALPHABET and lower in BASE58_ALPHABET:
+        return lower
+    return character
+
+
+def case_variants(text: str, case_sensitive: bool) -> List[str]:
+    if case_sensitive:
+        return [text]
+    choices = []
+    for character in text:
+        folded = fold_case(character)
+        choices.append(
+            sorted({c for c in (folded, folded.lower()) if fold_case(c) == folded and c in BASE58_ALPHABET})
+            or [character]
+        )
+    return ["".join(chars) for chars in product(*choices)]
+
+
+def fold_text(text: str) -> str:
+    return "".join(fold_case(c) for c in text)
+
+
+def pattern_indices(text: str, case_sensitive: bool) -> bytes:
+    """Pattern as kernel digits: base58 indices, folded for case-insensitive
+    pairs. Characters outside the alphabet become 0xFF and never match."""
+    if not case_sensitive:
+        text = fold_text(text)
+    return bytes(BASE58_ALPHABET.index(c) if c in BASE58_ALPHABET else 0xFF for c in text)
+
+
+def address_matches(address: str, prefix: str, suffix: str, case_sensitive: bool) -> bool:
+    """Host-side equivalent of the kernel comparison."""
+    if not case_sensitive:
+        address, prefix, suffix = fold_text(address), fold_text(prefix), fold_text(suffix)
+    return address.startswith(prefix) and address.endswith(suffix)
+
+
+def b58_value(text: str) -> int:
+    value = 0
+    for character in text:
+        value = value * 58 + BASE58_ALPHABET.index(character)
+    return value
+
+
+def prefix_range(prefix: str, address_length: int) -> Tuple[int, int]:
+    """Exact [lo, hi] of 256-bit public keys whose address has `address_length`
+    characters and starts with `prefix`. Returns lo > hi when empty."""
+    leading_ones = len(prefix) - len(prefix.lstrip("1"))
+    if leading_ones:
+        # every leading '1' is a zero byte, the rest of the prefix is not checked
+        return 0, (1 << (KEY_BITS - 8 * leading_ones)) - 1
+    tail = address_length - len(prefix)
+    if tail < 0:
+        return 1, 0
+    lo = b58_value(prefix) * 58 ** tail
+    hi = (b58_value(prefix) + 1) * 58 ** tail - 1
+    # keys below 2**248 have a zero leading byte and encode with a leading '1'
+    lo = max(lo, 58 ** (address_length - 1), 1 << (KEY_BITS - 8))
+    hi = min(hi, 58 ** address_length - 1, (1 << KEY_BITS) - 1)
+    return lo, hi
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def compile_prefix_ranges(
+    prefix: str, case_sensitive: bool, max_ranges: int = MAX_PREFIX_RANGES
+) -> List[Tuple[int, int]]:
+    """
+    Compile a prefix into at most `max_ranges` [lo, hi] ranges over the top 64
+    bits of the public key. Every key whose address starts with the prefix falls
+    into one of them; keys outside all ranges can skip base58 encoding. When the
+    case variants don't fit, the prefix is shortened, which only widens ranges.
+    An empty list means the prefix can't be filtered.
+    """
+    if not prefix or any(c not in BASE58_ALPHABET for c in prefix):
+        return []
+
+    for length in range(len(prefix), 0, -1):
+        variants = case_variants(prefix[:length], case_sensitive)
+        if len(variants) * len(ADDRESS_LENGTHS) > 4 * max_ranges:
+            continue
+        ranges = []
+        for variant in variants:
+            for address_length in ADDRESS_LENGTHS:
+                lo, hi = prefix_range(variant, address_length)
+                if lo <= hi:
+                    ranges.append((lo >> RANGE_SHIFT, hi >> RANGE_SHIFT))
+        ranges = merge_ranges(ranges)
+        if len(ranges) <= max_ranges:
+            return ranges
+    return []
+
+
+def compile_suffix_residues(suffix: str, case_sensitive: bool) -> Tuple[int, List[int]]:
+    """
+    The last k characters of an address are the public key modulo 58**k. Returns
+    the modulus and the residues (one per case variant) a key has to match.
+    A zero modulus means the suffix can't be filtered.
+    """
+    if not suffix or any(c not in BASE58_ALPHABET for c in suffix):
+        return 0, []
+
+    tail = suffix[-SUFFIX_RESIDUE_CHARS:]
+    residues = sorted({b58_value(variant) for variant in case_variants(tail, case_sensitive)})
+    return 58 ** len(tail), residues
+
+
+def prefix_reachable(prefix: str, case_sensitive: bool) -> bool:
+    """
+    Whether the address of some 32-byte key starts with `prefix`. A 44-character
+    address is below 2**256, so it can only start with '2'..'H', and a
+    43-character one is at least 2**248, so it can't start with '2'..'3'; longer
+    prefixes are bounded the same way. Checked exactly on the longest head of
+    the prefix whose case variants fit in MAX_REACHABLE_VARIANTS.
+    """
+    if not prefix or prefix.startswith("1"):
+        # leading '1's are zero bytes, any key may have them
+        return True
+
+    length = len(prefix)
+    while length > 1 and len(case_variants(prefix[:length], case_sensitive)) > MAX_REACHABLE_VARIANTS:
+        length -= 1
+    for variant in case_variants(prefix[:length], case_sensitive):
+        for address_length in ADDRESS_LENGTHS:
+            lo, hi = prefix_range(variant, address_length)
+            if lo <= hi:
+                return True
+    return False
+
+
+def pattern_error(prefix: str, suffix: str, case_sensitive: bool) -> Optional[str]:
+    """Why no address can match the pattern, or None when it is searchable."""
+    for name, text in (("prefix", prefix), ("suffix", suffix)):
+        for character in text:
+            folded = character if case_sensitive else fold_case(character)
+            if folded not in BASE58_ALPHABET:
+                return f"{name} {text!r} has {character!r}, which is not a base58 character"
+    if len(prefix) + len(suffix) > max(ADDRESS_LENGTHS):
+        return f"prefix and suffix are longer than an address ({max(ADDRESS_LENGTHS)} characters)"
+    if not prefix_reachable(prefix, case_sensitive):
+        return f"no 32-byte key has an address starting with {prefix!r}"
+    return None
@@ -0,0 +1,70 @@
+import queue
+import threading
+from typing import Callable, Optional, Tuple
+
+from base58 import b58encode
+from loguru import logger
+
+from core.cpu_searcher import derive_keypair
+from core.utils.filters import address_matches
+
+
+def verify_hit(secret_key: bytes, prefix: str, suffix: str, case_sensitive: bool) -> Optional[str]:
+    """Re-derive the public key from the seed and check the pattern; return the address if both hold."""
+    if derive_keypair(secret_key[:32]) != secret_key:
+        return None
+    address = b58encode(secret_key[32:]).decode()
+    if not address_matches(address, prefix, suffix, case_sensitive):
+        return None
+    return address
+
+
+class HitVerifier(threading.Thread):
+    """
+    Checks hits off the search loop. Verified hits go to `on_verified(pair,
+    address, private_key)`; pairs whose hit fails verification are put on
+    `rejected` so the search loop can reactivate them.
+    """
+
+    def __init__(self, on_verified: Callable[[Tuple, str, str], None]):
+        super().__init__(daemon=True)
+        self.on_verified = on_verified
+        self.tasks = queue.Queue()
+        self.rejected = queue.Queue()
+
+    def submit(self, pair: Tuple, case_sensitive: bool, secret_key: bytes):
+        self.tasks.put((pair, case_sensitive, secret_key))
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                self.tasks.task_done()
+                break
+
+            pair, case_sensitive, secret_key = task
+            _, prefix, suffix = pair
+            try:
+                address = verify_hit(secret_key, prefix, suffix, case_sensitive)
+                if address is None:
+                    logger.error(f"Hit for {pair} failed verification, searching again")
+                    self.rejected.put(pair)
+                else:
+                    self.on_verified(pair, address, b58encode(secret_key).decode())
+            except Exception as e:
+                logger.exception(e)
+                self.rejected.put(pair)
+            finally:
+                self.tasks.task_done()
+
+    def take_rejected(self) -> list:
+        rejected = []
+        while True:
+            try:
+                rejected.append(self.rejected.get_nowait())
+            except queue.Empty:
+                return rejected
+
+    def stop(self):
+        self.tasks.put(None)
+        self.join()
@@ -0,0 +1,261 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from core.engine import Result, SearchEngine
+from core.utils.filters import pattern_error
+
+# how many jobs are searched at once, more messages wait in the subscription
+MAX_JOBS = 64
+# acknowledgements are sent in batches: by size or by time (seconds)
+ACK_BATCH_SIZE = 100
+ACK_INTERVAL = 1.0
+# in-flight messages get their ack deadline extended on receipt and then this often, by ACK_DEADLINE seconds
+EXTEND_INTERVAL = 20
+ACK_DEADLINE = 60
+
+GENERATED = "on_generated"
+ERROR = "on_error"
+
+
+class Message(NamedTuple):
+    ack_id: str
+    data: bytes
+
+
+class Job(NamedTuple):
+    ack_id: str
+    job_id: str
+    prefix: str
+    suffix: str
+    case_sensitive: bool
+
+
+class Transport(ABC):
+    """
+    Where generate requests come from and results go to. `receive` blocks
+    for at most `timeout` seconds; `publish` must not wait for delivery and
+    calls `on_done(error)` once the message is published or has failed.
+    """
+
+    @abstractmethod
+    def receive(self, max_messages: int, timeout: float) -> List[Message]:
+        ...
+
+    @abstractmethod
+    def ack(self, ack_ids: List[str]):
+        ...
+
+    @abstractmethod
+    def extend(self, ack_ids: List[str], seconds: int):
+        """Push back the redelivery of messages still being worked on."""
+
+    @abstractmethod
+    def publish(self, topic: str, data: bytes, on_done: Callable[[Optional[Exception]], None]):
+        ...
+
+    @abstractmethod
+    def close(self):
+        ...
+
+
+class LocalTransport(Transport):
+    """In-process stand-in for Pub/Sub: `send` requests, read `published` and `acked`."""
+
+    def __init__(self):
+        self.incoming: "queue.Queue[Message]" = queue.Queue()
+        self.published: "queue.Queue[tuple]" = queue.Queue()
+        self.acked: List[str] = []
+        self.ids = itertools.count()
+
+    def send(self, payload: dict) -> str:
+        ack_id = str(next(self.ids))
+        self.incoming.put(Message(ack_id, json.dumps(payload).encode("utf-8")))
+        return ack_id
+
+    def receive(self, max_messages: int, timeout: float) -> List[Message]:
+        messages = []
+        try:
+            messages.append(self.incoming.get(timeout=timeout))
+            while len(messages) < max_messages:
+                messages.append(self.incoming.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def ack(self, ack_ids: List[str]):
+        self.acked.extend(ack_ids)
+
+    def extend(self, ack_ids: List[str], seconds: int):
+        # nothing is redelivered in process
+        pass
+
+    def publish(self, topic: str, data: bytes, on_done: Callable[[Optional[Exception]], None]):
+        self.published.put((topic, json.loads(data)))
+        on_done(None)
+
+    def close(self):
+        pass
+
+
+def parse_job(message: Message) -> Job:
+    body = json.loads(message.data.decode("utf-8"))
+    case_sensitive = body.get("isCaseSensitive", True)
+    if isinstance(case_sensitive, str):
+        case_sensitive = case_sensitive == "True"
+    return Job(message.ack_id, body["jobId"], body.get("prefix", ""), body.get("suffix", ""), bool(case_sensitive))
+
+
+class ConsumerService:
+    """
+    Long-lived consumer: generate requests from `transport` are searched
+    concurrently, up to `max_jobs`, on the persistent workers of `engine`.
+    Results and errors are published without waiting for delivery, and a
+    message is acknowledged, in batches, only once its answer is published;
+    until then its ack deadline is extended, so a crash means redelivery
+    rather than a lost job.
+    """
+
+    def __init__(
+        self,
+        engine: SearchEngine,
+        transport: Transport,
+        max_jobs: int = MAX_JOBS,
+        ack_batch_size: int = ACK_BATCH_SIZE,
+        ack_interval: float = ACK_INTERVAL,
+    ):
+        self.engine = engine
+        self.transport = transport
+        self.max_jobs = max_jobs
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+
+        self.lock = threading.Lock()
+        self.row_ids = itertools.count()
+        # row_id -> job being searched
+        self.jobs: Dict[int, Job] = {}
+        self.slots = threading.Semaphore(max_jobs)
+        self.acks: "queue.Queue[str]" = queue.Queue()
+        self.stopping = threading.Event()
+        self.receiver = threading.Thread(target=self.receive_loop, daemon=True)
+
+    def in_flight(self) -> List[str]:
+        with self.lock:
+            return [job.ack_id for job in self.jobs.values()]
+
+    def receive_loop(self):
+        while not self.stopping.is_set():
+            self.slots.acquire()
+            free = 1
+            while free < self.max_jobs and self.slots.acquire(blocking=False):
+                free += 1
+            try:
+                messages = self.transport.receive(free, timeout=1.0)
+            except Exception as e:
+                logging.error(f"Receive failed: {e}")
+                messages = []
+                time.sleep(1)
+            for _ in range(free - len(messages)):
+                self.slots.release()
+            if messages:
+                self.transport.extend([message.ack_id for message in messages], ACK_DEADLINE)
+            for message in messages:
+                self.start_job(message)
+
+    def start_job(self, message: Message):
+        try:
+            job = parse_job(message)
+        except (ValueError, KeyError) as e:
+            logging.error(f"Bad generate message {message.data!r}: {e}")
+            # a malformed message would be redelivered forever
+            self.acks.put(message.ack_id)
+            self.slots.release()
+            return
+
+        error = pattern_error(job.prefix, job.suffix, job.case_sensitive)
+        if error:
+            logging.error(f"Job {job.job_id}: {error}")
+            self.finish(job, ERROR, {"error": error, "jobId": job.job_id})
+            return
+
+        logging.info(f"Job {job.job_id}: searching {job.prefix!r}/{job.suffix!r}")
+        self.submit(job)
+
+    def submit(self, job: Job):
+        with self.lock:
+            row_id = next(self.row_ids)
+            self.jobs[row_id] = job
+        self.engine.submit([(row_id, job.prefix, job.suffix, job.case_sensitive)])
+
+    def handle_result(self, result: Result):
+        with self.lock:
+            job = self.jobs.pop(result.row_id, None)
+        if job is None:
+            return
+        if result.address is None:
+            self.finish(job, ERROR, {"error": result.reason, "jobId": job.job_id})
+            return
+        logging.info(f"Job {job.job_id}: found {result.address}")
+        self.finish(job, GENERATED, {"privateKey": result.private_key, "pubKey": result.address, "jobId": job.job_id})
+
+    def finish(self, job: Job, topic: str, payload: dict):
+        def on_done(error: Optional[Exception]):
+            if error is None:
+                self.acks.put(job.ack_id)
+            else:
+                # not acknowledged: the job is redelivered once its deadline passes
+                logging.error(f"Job {job.job_id}: publishing to {topic} failed: {error}")
+
+        self.slots.release()
+        self.transport.publish(topic, json.dumps(payload).encode("utf-8"), on_done)
+
+    def flush_acks(self):
+        ack_ids = []
+        while True:
+            try:
+                ack_ids.append(self.acks.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(ack_ids), self.ack_batch_size):
+            batch = ack_ids[start:start + self.ack_batch_size]
+            try:
+                self.transport.ack(batch)
+            except Exception as e:
+                logging.error(f"Acknowledging {len(batch)} message(s) failed: {e}")
+
+    def run(self):
+        self.engine.start()
+        self.receiver.start()
+        logging.info("Listening for generate events, generator is live")
+
+        last_flush = last_extend = time.time()
+        try:
+            while not self.stopping.is_set():
+                result = self.engine.get(timeout=self.ack_interval)
+                while result is not None:
+                    self.handle_result(result)
+                    result = self.engine.get(timeout=0)
+
+                now = time.time()
+                if self.acks.qsize() >= self.ack_batch_size or now - last_flush >= self.ack_interval:
+                    self.flush_acks()
+                    last_flush = now
+                if now - last_extend >= EXTEND_INTERVAL:
+                    in_flight = self.in_flight()
+                    if in_flight:
+                        self.transport.extend(in_flight, ACK_DEADLINE)
+                    last_extend = now
+        finally:
+            self.stopping.set()
+            self.engine.stop()
+            self.flush_acks()
+            self.transport.close()
+
+    def stop(self):
+        """Make `run` return; answers not published yet are redelivered later."""
+        self.stopping.set()
@@ -0,0 +1,57 @@
+import logging
+from typing import Callable, List, Optional
+
+from google.api_core import exceptions
+from google.cloud import pubsub_v1
+
+from consumer import Message, Transport
+
+
+class PubSubTransport(Transport):
+    """
+    Google Pub/Sub behind the Transport interface: synchronous pull, so the
+    consumer decides when and in which batches messages are acknowledged,
+    and publishing through the client's own batching.
+    """
+
+    def __init__(
+        self,
+        subscriber: pubsub_v1.SubscriberClient,
+        publisher: pubsub_v1.PublisherClient,
+        project_id: str,
+        subscription: str,
+    ):
+        self.subscriber = subscriber
+        self.publisher = publisher
+        self.project_id = project_id
+        self.subscription = subscriber.subscription_path(project_id, subscription)
+
+    def receive(self, max_messages: int, timeout: float) -> List[Message]:
+        try:
+            response = self.subscriber.pull(
+                request={"subscription": self.subscription, "max_messages": max_messages},
+                timeout=timeout,
+            )
+        except exceptions.DeadlineExceeded:
+            return []
+        return [Message(received.ack_id, received.message.data) for received in response.received_messages]
+
+    def ack(self, ack_ids: List[str]):
+        self.subscriber.acknowledge(request={"subscription": self.subscription, "ack_ids": ack_ids})
+
+    def extend(self, ack_ids: List[str], seconds: int):
+        try:
+            self.subscriber.modify_ack_deadline(
+                request={"subscription": self.subscription, "ack_ids": ack_ids, "ack_deadline_seconds": seconds}
+            )
+        except exceptions.GoogleAPICallError as e:
+            logging.error(f"Extending {len(ack_ids)} ack deadline(s) failed: {e}")
+
+    def publish(self, topic: str, data: bytes, on_done: Callable[[Optional[Exception]], None]):
+        future = self.publisher.publish(self.publisher.topic_path(self.project_id, topic), data)
+        future.add_done_callback(lambda f: on_done(f.exception()))
+
+    def close(self):
+        # waits for the messages still batched in the publisher
+        self.publisher.stop()
+        self.subscriber.close()
@@ -1,19 +1,46 @@
+import signal
 import sys
 import multiprocessing
 
 from loguru import logger
-from math import ceil
 
+from core.estimator import estimate_seconds, expected_attempts
 from core.postgres import Postgres
+from core.result_writer import ResultWriter
 from core.config import DEFAULT_ITERATION_BITS, HostSetting
+from core.gpu_worker import multi_gpu_worker
+from core.metrics import Metrics, serve_metrics
+from core.scheduler import Scheduler
+from core.stock import StockStore, parse_stock_patterns, stock_row_id
 from core.opencl.manager import (
     get_all_gpu_devices,
 )
-from core.gpu_worker import multi_gpu_worker
-from core.utils.helpers import check_character, load_kernel_source
+from core.utils.filters import pattern_error
+from core.utils.helpers import load_kernel_source
 from core.utils.parser import parse_wallet_pattern
 
-from config import DB_CONFIG, SUBCHUNK_MAX
+from config import (
+    ATTEMPT_BUDGET_FACTOR,
+    ATTEMPT_BUDGET_MIN_LAUNCHES,
+    COMPUTE_BUDGET_SECONDS,
+    CPU_WORKER,
+    DB_CONFIG,
+    DEFAULT_CPU_ITERATION_BITS,
+    ESTIMATE_CPU_KEYS_PER_SEC,
+    ESTIMATE_GPU_KEYS_PER_SEC,
+    METRICS_HOST,
+    METRICS_PORT,
+    OVER_BUDGET_ACTION,
+    REBALANCE_AFTER,
+    SCHEDULER_BATCH_ATTEMPTS,
+    STOCK_KEY,
+    STOCK_LOW_WATER,
+    STOCK_PATH,
+    STOCK_PATTERNS,
+    STOCK_TARGET,
+    SUBCHUNK_MAX,
+    WORKER_STOP_TIMEOUT,
+)
 
 logger.remove()
 logger.add(sys.stdout, level="INFO")
@@ -21,15 +48,21 @@ logger.add(sys.stdout, level="INFO")
 task_queues = None
 gpu_counts = 0
 processes = []
+scheduler = None
+postgres = None
+writer = None
+stock = None
+metrics = Metrics()
 
 
-def start_gpu_workers(setting: HostSetting, chosen_devices=None):
+def start_gpu_workers(setting: HostSetting, chosen_devices=None, backends=None, events=None):
     global task_queues, gpu_counts, processes
 
     task_queues = []
     processes = []
+    backends = backends or ["gpu"] * gpu_counts
 
-    for index in range(gpu_counts):
+    for index, backend in enumerate(backends):
         queue = multiprocessing.Queue()
         task_queues.append(queue)
 
@@ -37,9 +70,11 @@ def start_gpu_workers(setting: HostSetting, chosen_devices=None):
             target=multi_gpu_worker,
             args=(
                 index,
-                setting,
+                setting if backend == "gpu" else cpu_setting(setting),
                 queue,
+                events,
                 chosen_devices,
+                backend,
             ),
         )
         p.start()
@@ -48,10 +83,88 @@ def start_gpu_workers(setting: HostSetting, chosen_devices=None):
     return processes, task_queues
 
 
-def event_new_row(rows):
-    global gpu_counts
-    global task_queues
+def stop_workers():
+    # None вместо terminate: воркер доделывает запуски и пишет свой trace
+    scheduler.stop()
+    for queue in task_queues:
+        queue.put(None)
+    for p in processes:
+        p.join(WORKER_STOP_TIMEOUT)
+        if p.is_alive():
+            logger.warning(f"Worker {p.pid} did not stop in {WORKER_STOP_TIMEOUT}s, terminating")
+            p.terminate()
+
+
+def cpu_setting(setting: HostSetting) -> HostSetting:
+    return HostSetting(
+        setting.kernel_source,
+        iteration_bits=DEFAULT_CPU_ITERATION_BITS,
+        hit_capacity=setting.hit_capacity,
+        use_profile=False,
+    )
+
 
+def count_gpu_devices() -> int:
+    try:
+        return len(get_all_gpu_devices())
+    except Exception as e:
+        # no OpenCL platform at all
+        logger.warning(f"Can't list OpenCL GPUs: {e}")
+        return 0
+
+
+def worker_backends(gpu_total: int):
+    backends = ["gpu"] * gpu_total
+    if CPU_WORKER == "on" or (CPU_WORKER == "auto" and gpu_total == 0):
+        # one CPU worker already uses every core through its process pool
+        backends.append("cpu")
+    return backends
+
+
+def open_stock():
+    """StockStore for STOCK_PATTERNS, None when stock is off."""
+    if not STOCK_PATTERNS:
+        return None
+    patterns = parse_stock_patterns(STOCK_PATTERNS, STOCK_LOW_WATER, STOCK_TARGET)
+    if not patterns:
+        return None
+    try:
+        key = bytes.fromhex(STOCK_KEY)
+    except ValueError:
+        key = b""
+    if len(key) != 32:
+        logger.error("STOCK_PATTERNS is set but STOCK_KEY is not 32 bytes in hex")
+        sys.exit(1)
+    return StockStore(STOCK_PATH, key, patterns, metrics)
+
+
+def stock_tasks():
+    # шаблоны ниже порога запаса, их добирают простаивающие воркеры: по копии на каждый недостающий ключ
+    return [
+        (stock_row_id(prefix, suffix, copy), prefix, suffix, True)
+        for (prefix, suffix), missing in stock.wanted()
+        for copy in range(missing)
+    ]
+
+
+def admit(row_id, prefix: str, suffix: str, case_sensitive: bool) -> bool:
+    """Write the ETA to the row; rows over COMPUTE_BUDGET_SECONDS are rejected or deferred."""
+    attempts = expected_attempts(prefix, suffix, case_sensitive)
+    eta = estimate_seconds(attempts, scheduler.keys_per_sec())
+
+    if eta is not None and eta <= COMPUTE_BUDGET_SECONDS:
+        postgres.update_estimate(row_id, attempts, eta)
+        return True
+
+    status = "deferred" if OVER_BUDGET_ACTION == "defer" else "error"
+    message = f"over compute budget: ETA {eta or float('inf'):.0f}s > {COMPUTE_BUDGET_SECONDS:.0f}s"
+    logger.warning(f"{status} -> {prefix} --> {suffix} (row_id: {row_id}): {message}")
+    postgres.update_estimate(row_id, attempts, eta, status, message)
+    metrics.inc("solvanity_tasks_total", outcome=f"over_budget_{status}")
+    return False
+
+
+def event_new_row(rows):
     batch = []
 
     logger.info("Добавляем новую партию...")
@@ -64,41 +177,81 @@ def event_new_row(rows):
         if wallet_start == '':
             wallet_start = "x"
 
-        check_character("starts_with", wallet_start)
-        check_character("ends_with", wallet_end)
+        # шаблон, который не может совпасть ни с одним адресом, сразу в error
+        error = pattern_error(wallet_start, wallet_end, case_sensitive)
+        if error:
+            logger.error(f"reject -> {wallet_start} --> {wallet_end} (row_id: {row_id}): {error}")
+            writer.put_error(row_id, error)
+            metrics.inc("solvanity_tasks_total", outcome="rejected")
+            continue
+
+        if not scheduler.has(row_id):
+            # короткие шаблоны отдаём из запаса, не дожидаясь GPU
+            found = stock.take(wallet_start, wallet_end) if stock is not None else None
+            if found:
+                address, private_key = found
+                logger.info(f"stock -> {wallet_start} --> {wallet_end} (row_id: {row_id}): {address}")
+                writer.put(row_id, address, private_key)
+                metrics.inc("solvanity_tasks_total", outcome="stock")
+                continue
+            if not admit(row_id, wallet_start, wallet_end, case_sensitive):
+                continue
 
         logger.info(f"add -> {wallet_start} --> {wallet_end}")
 
         batch.append((row_id, wallet_start, wallet_end, case_sensitive))
 
-    batch_size = len(batch)
-    chunk_size = ceil(batch_size / gpu_counts)
-
-    for i in range(gpu_counts):
-        start = i * chunk_size
-        end = min(start + chunk_size, batch_size)
-        chunk = batch[start:end]
-        if chunk:
-            if len(chunk) > SUBCHUNK_MAX:
-                for j in range(0, len(chunk), SUBCHUNK_MAX):
-                    subchunk = chunk[j:j + SUBCHUNK_MAX]
-                    task_queues[i].put(subchunk)
-                    logger.info(f"Added to queue: {len(subchunk)}")
-            else:
-                task_queues[i].put(chunk)
-                logger.info(f"Added to queue: {len(chunk)}")
+    # задачи разбирают свободные GPU через общий пул планировщика
+    scheduler.add(batch)
+    logger.info(f"Added to pool: {len(batch)}")
 
 
 def main():
-    global processes, task_queues, gpu_counts
+    global processes, task_queues, gpu_counts, scheduler, postgres, writer, stock
 
     kernel_source = load_kernel_source()
     setting = HostSetting(kernel_source, iteration_bits=DEFAULT_ITERATION_BITS)
-    gpu_counts = len(get_all_gpu_devices())
-
-    logger.info("Start task worker...")
+    backends = worker_backends(count_gpu_devices())
+    gpu_counts = len(backends)
+
+    if gpu_counts == 0:
+        logger.error("No OpenCL GPUs found and CPU_WORKER=off, nothing to run searches on")
+        sys.exit(1)
+
+    logger.info(f"Start task worker... ({', '.join(backends)})")
+
+    events = multiprocessing.Queue()
+    # запас открываем до запуска воркеров: с неверным STOCK_KEY сервер должен сразу выйти
+    stock = open_stock()
+
+    processes, task_queues = start_gpu_workers(setting, None, backends, events)
+
+    # найденные адреса пишутся в БД одним потоком, пачками
+    writer = ResultWriter(DB_CONFIG, metrics)
+    writer.start()
+
+    scheduler = Scheduler(
+        task_queues,
+        events,
+        batch_size=SUBCHUNK_MAX,
+        batch_attempts=SCHEDULER_BATCH_ATTEMPTS,
+        rebalance_after=REBALANCE_AFTER,
+        default_speeds=[
+            ESTIMATE_GPU_KEYS_PER_SEC if backend == "gpu" else ESTIMATE_CPU_KEYS_PER_SEC
+            for backend in backends
+        ],
+        on_found=writer.put,
+        on_failed=writer.put_error,
+        attempt_budget=ATTEMPT_BUDGET_FACTOR,
+        metrics=metrics,
+        idle_tasks=stock_tasks if stock is not None else None,
+        on_idle_found=stock.put if stock is not None else None,
+        min_budget=ATTEMPT_BUDGET_MIN_LAUNCHES * setting.global_work_size,
+    )
+    scheduler.start()
 
-    processes, task_queues = start_gpu_workers(setting, None)
+    if METRICS_PORT:
+        serve_metrics(metrics, METRICS_HOST, METRICS_PORT)
 
     logger.info("Init database...")
 
@@ -108,7 +261,17 @@ def main():
 
     logger.info("Start listener...")
 
-    postgres.start_listen(event_new_row)
+    # SIGTERM (docker stop) завершает через finally, как и Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        # найденные, но ещё не записанные строки тоже держим, иначе их заберёт другой сервер
+        postgres.start_listen(event_new_row, held_rows=lambda: scheduler.row_ids() + writer.unflushed())
+    finally:
+        logger.info("Stopping workers...")
+        stop_workers()
+        # дописываем в БД (или в spill-файл) всё, что уже найдено
+        logger.info("Stopping, flushing results...")
+        writer.stop()
 
 
 if __name__ == "__main__":